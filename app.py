@@ -1,37 +1,201 @@
-from flask import Flask, request, redirect, render_template_string, url_for
+from flask import Flask, request, redirect, render_template, stream_template, stream_with_context, url_for, make_response, send_from_directory, abort, g, session, has_request_context
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session as FlaskSession
 from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
-from werkzeug.security import generate_password_hash, check_password_hash
-from datetime import datetime
-import html
+from werkzeug.security import generate_password_hash
+from sqlalchemy import event
+from sqlalchemy.orm import joinedload, object_session
+from markupsafe import Markup
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+import hashlib
+import json
+import mimetypes
+import threading
+import time
 import click
+from functools import wraps
 import os
 
+import bulk
+from cache import make_cache
+from compression import CompressionMiddleware
+from database import configure_engine, disable_statement_timeout, engine_options
+from events import make_broker
+from replicas import ReplicaSet
+from hashing import PasswordHasher, PoolBusy
+from instrumentation import Instrumentation
+import search
+
 # --- Application Setup ---
 app = Flask(__name__)
 
 # --- Configuration ---
 # Use DATABASE_URL from environment variables (provided by Render)
 # Fallback to local sqlite for development (optional)
-# Replace postgres:// with postgresql:// for SQLAlchemy compatibility
-db_url = os.environ.get('DATABASE_URL', 'sqlite:///forum.db')
-if db_url.startswith("postgres://"):
-    db_url = db_url.replace("postgres://", "postgresql://", 1)
+# Replace postgres:// with postgresql:// for SQLAlchemy compatibility, and
+# name the psycopg2 driver from requirements.txt (SQLAlchemy 2.1 otherwise
+# picks psycopg 3, while events.py, bulk.py and psycogreen use psycopg2)
+def normalize_db_url(url):
+    if url.startswith("postgres://"):
+        url = url.replace("postgres://", "postgresql://", 1)
+    if url.startswith("postgresql://"):
+        url = url.replace("postgresql://", "postgresql+psycopg2://", 1)
+    return url
+
+db_url = normalize_db_url(os.environ.get('DATABASE_URL', 'sqlite:///forum.db'))
 app.config['SQLALCHEMY_DATABASE_URI'] = db_url
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# Connection pool per gunicorn worker (Postgres): size it to the number of
+# requests a worker should query for at once (/events streams only borrow a
+# connection while rendering an event); workers * (DB_POOL_SIZE +
+# DB_MAX_OVERFLOW) must stay below the server's connection limit. Statements
+# running longer than DB_STATEMENT_TIMEOUT_MS are cancelled by the server
+# (0 disables); migrations, import and archive lift the limit for their own
+# transactions.
+engine_tuning = dict(
+    pool_size=int(os.environ.get('DB_POOL_SIZE', 6)),
+    max_overflow=int(os.environ.get('DB_MAX_OVERFLOW', 2)),
+    pool_timeout=int(os.environ.get('DB_POOL_TIMEOUT', 10)),
+    pool_recycle=int(os.environ.get('DB_POOL_RECYCLE', 1800)),
+    statement_timeout_ms=int(os.environ.get('DB_STATEMENT_TIMEOUT_MS', 5000)),
+    sqlite_busy_timeout_ms=int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000)),
+)
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(db_url, **engine_tuning)
+# Optional comma-separated read replicas of DATABASE_URL, each with its own pool
+# as above. Unhealthy replicas are probed again every REPLICA_CHECK_INTERVAL
+# seconds; after a write, the writer reads from the primary for
+# READ_YOUR_WRITES_SECONDS (longer than the usual replication lag).
+read_urls = [normalize_db_url(url.strip()) for url in os.environ.get('DATABASE_READ_URLS', '').split(',') if url.strip()]
+app.config['SQLALCHEMY_BINDS'] = {
+    f'replica{i}': {'url': url, **engine_options(url, **engine_tuning)} for i, url in enumerate(read_urls)
+}
+app.config['REPLICA_CHECK_INTERVAL'] = int(os.environ.get('REPLICA_CHECK_INTERVAL', 10))
+app.config['READ_YOUR_WRITES_SECONDS'] = int(os.environ.get('READ_YOUR_WRITES_SECONDS', 10))
 # Use SECRET_KEY from environment variables (set this in Render)
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'default-dev-secret-key-CHANGE-ME') # Provide a default for local dev if needed
+# Number of posts shown per feed page
+app.config['FEED_PAGE_SIZE'] = int(os.environ.get('FEED_PAGE_SIZE', 50))
+# Posts read from the database and rendered per step while streaming the feed
+app.config['FEED_STREAM_BATCH'] = int(os.environ.get('FEED_STREAM_BATCH', 10))
+# Latest replies shown under each post in the feed; the rest of a thread is
+# loaded from /post/<id>/replies, REPLIES_PAGE_SIZE at a time
+app.config['FEED_REPLIES'] = int(os.environ.get('FEED_REPLIES', 3))
+app.config['REPLIES_PAGE_SIZE'] = int(os.environ.get('REPLIES_PAGE_SIZE', 50))
+# Rendered post fragments: kept in each worker's memory by default, or shared
+# by all workers with e.g. FRAGMENT_CACHE_URL=redis://localhost:6379/0
+app.config['FRAGMENT_CACHE_URL'] = os.environ.get('FRAGMENT_CACHE_URL')
+app.config['FRAGMENT_CACHE_SIZE'] = int(os.environ.get('FRAGMENT_CACHE_SIZE', 5000))
+# Cache-Control for anonymous feed pages: browsers revalidate (cheap 304s),
+# shared caches such as a CDN or reverse proxy may serve a copy this long
+app.config['FEED_MAX_AGE'] = int(os.environ.get('FEED_MAX_AGE', 0))
+app.config['FEED_SHARED_MAX_AGE'] = int(os.environ.get('FEED_SHARED_MAX_AGE', 10))
+# Opt-in request / SQL instrumentation, exposed to admins at /admin/metrics.
+# Prometheus can scrape it with "Authorization: Bearer $METRICS_TOKEN".
+app.config['INSTRUMENTATION'] = os.environ.get('INSTRUMENTATION', '').lower() in ('1', 'true', 'yes')
+app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN')
+app.config['SLOW_QUERY_MS'] = float(os.environ.get('SLOW_QUERY_MS', 100))
+# Fraction of requests (0-1) to run under cProfile, dumped to PROFILE_DIR
+app.config['PROFILE_SAMPLE_RATE'] = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+app.config['PROFILE_DIR'] = os.environ.get('PROFILE_DIR', 'profiles')
+# Password hashing runs on a small pool of real threads per worker (also
+# under gevent, see hashing.py); requests beyond HASH_POOL_WORKERS running +
+# HASH_QUEUE_LIMIT waiting get a 503 right away. A hash takes ~50-100 ms, so a
+# full queue clears in about a second: bursts of logins wait instead of
+# failing, while a flood is turned away before it piles up.
+app.config['HASH_POOL_WORKERS'] = int(os.environ.get('HASH_POOL_WORKERS', 2))
+app.config['HASH_QUEUE_LIMIT'] = int(os.environ.get('HASH_QUEUE_LIMIT', 32))
+app.config['HASH_POOL_KIND'] = os.environ.get('HASH_POOL_KIND', 'thread')  # or 'process'
+# Seconds a logged-in user's name and admin flag are served from the cache
+# above instead of the database. ORM changes invalidate it right away in a
+# shared (Redis) cache; with per-worker caches, other workers and the CLI
+# see a change after at most this long.
+app.config['USER_CACHE_TTL'] = int(os.environ.get('USER_CACHE_TTL', 60))
+# Results per /search page, and how deep into the results paging may go
+app.config['SEARCH_PAGE_SIZE'] = int(os.environ.get('SEARCH_PAGE_SIZE', 20))
+app.config['SEARCH_MAX_PAGES'] = int(os.environ.get('SEARCH_MAX_PAGES', 50))
+# Live feed updates (/events). With the gevent workers of gunicorn.conf.py an
+# open stream is a greenlet; SSE_MAX_STREAMS per worker must leave room in
+# WORKER_CONNECTIONS for pages and logins (with thread workers, in --threads),
+# extra browsers are told to retry later. Streams end after SSE_MAX_DURATION
+# seconds (the browser reconnects) and send a heartbeat every SSE_HEARTBEAT.
+app.config['SSE_MAX_STREAMS'] = int(os.environ.get('SSE_MAX_STREAMS', 800))
+app.config['SSE_MAX_DURATION'] = int(os.environ.get('SSE_MAX_DURATION', 300))
+app.config['SSE_HEARTBEAT'] = int(os.environ.get('SSE_HEARTBEAT', 15))
+
+# Compress HTML (streamed or not) for clients that accept gzip or brotli
+app.wsgi_app = CompressionMiddleware(app.wsgi_app)
+
+# --- Read Replicas ---
+# With DATABASE_READ_URLS set, GET and HEAD requests read from the replicas
+# (round-robin, skipping unhealthy ones; see replicas.py) and everything else
+# goes to the primary. A request sticks to the replica it got first, so its
+# queries all see the same snapshot (replicas can lag by different amounts,
+# and e.g. the feed's ETag must match the posts rendered under it). A commit that wrote something pins the writer's
+# following reads to the primary for READ_YOUR_WRITES_SECONDS, through a
+# timestamp in their session cookie. GET routes that write are marked with
+# @use_primary, and so is /events, which renders posts as soon as the primary
+# commits them.
+def reads_from_replica():
+    if not replicas or not has_request_context() or request.method not in ('GET', 'HEAD'):
+        return False
+    if g.get('use_primary'):
+        return False
+    return session.get('primary_until', 0) < time.time()
+
+class RoutingSession(FlaskSession):
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and reads_from_replica():
+            if 'replica' not in g:
+                g.replica = replicas.pick()  # None when all are down: the primary, for the whole request
+            if g.replica is not None:
+                return g.replica
+        return super().get_bind(mapper, clause, bind=bind, **kwargs)
+
+@event.listens_for(RoutingSession, 'after_flush')
+def remember_write(db_session, flush_context):
+    db_session.info['wrote'] = True
+
+@event.listens_for(RoutingSession, 'after_commit')
+def read_your_writes(db_session):
+    if db_session.info.pop('wrote', False) and replicas and has_request_context():
+        g.use_primary = True  # The rest of this request too, e.g. a fragment rendered after the write
+        session['primary_until'] = time.time() + app.config['READ_YOUR_WRITES_SECONDS']
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def forget_write(db_session):
+    db_session.info.pop('wrote', None)
+
+def use_primary(view):
+    """For GET routes that write or must see the latest commit: keeps their queries on the primary."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        g.use_primary = True
+        return view(*args, **kwargs)
+    return wrapper
 
 # --- Database and Login Manager Initialization ---
-db = SQLAlchemy(app)
+db = SQLAlchemy(app, session_options={'class_': RoutingSession})
+with app.app_context():
+    configure_engine(db.engine)  # WAL, synchronous=NORMAL for SQLite
+    broker = make_broker(db.engine)  # Postgres LISTEN/NOTIFY, or in-process
+    replica_engines = [db.engines[key] for key in app.config['SQLALCHEMY_BINDS']]
+    for engine in replica_engines:
+        configure_engine(engine)
+    replicas = ReplicaSet(replica_engines, app.config['REPLICA_CHECK_INTERVAL'])
+stream_slots = threading.BoundedSemaphore(app.config['SSE_MAX_STREAMS'])
+cache = make_cache(app.config['FRAGMENT_CACHE_URL'], app.config['FRAGMENT_CACHE_SIZE'])
 login_manager = LoginManager(app)
 login_manager.login_view = 'login' # Route name for the login page
+instrumentation = Instrumentation(app) if app.config['INSTRUMENTATION'] else None
+password_hasher = PasswordHasher(app.config['HASH_POOL_WORKERS'], app.config['HASH_QUEUE_LIMIT'],
+                                 app.config['HASH_POOL_KIND'])
 
 # --- Models ---
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(50), unique=True, nullable=False)
-    password_hash = db.Column(db.String(128), nullable=False)
+    password_hash = db.Column(db.String(255), nullable=False)  # scrypt hashes are 162 characters
     is_admin = db.Column(db.Boolean, default=False)
     posts = db.relationship('Post', backref='author', lazy=True)
     replies = db.relationship('Reply', backref='author', lazy=True)
@@ -41,7 +205,16 @@ class Post(db.Model):
     content = db.Column(db.Text, nullable=False)
     date = db.Column(db.DateTime, default=datetime.utcnow)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    replies = db.relationship('Reply', backref='post', lazy=True, cascade='all, delete-orphan')
+    # Denormalized from the replies; updated in the same statement that adds or removes one
+    reply_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    last_reply_at = db.Column(db.DateTime)
+    replies = db.relationship('Reply', backref='post', lazy=True, cascade='all, delete-orphan', order_by='Reply.date')
+
+    # Keep in sync with the migrations below
+    __table_args__ = (
+        db.Index('ix_post_date_id', 'date', 'id'),  # feed order and keyset cursor
+        db.Index('ix_post_user_id', 'user_id'),
+    )
 
 class Reply(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -50,226 +223,429 @@ class Reply(db.Model):
     post_id = db.Column(db.Integer, db.ForeignKey('post.id'), nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
 
+    __table_args__ = (
+        db.Index('ix_reply_post_id_date', 'post_id', 'date'),  # replies of a post, cascade delete
+        db.Index('ix_reply_user_id', 'user_id'),
+    )
+
+class FeedState(db.Model):
+    """Single row (id=1) bumped by every write that changes the feed.
+
+    Its version and timestamp are the feed's HTTP validators, so a conditional
+    request can be answered without querying or rendering any posts.
+    """
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    changed_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+class PostArchive(db.Model):
+    """Posts moved out of the hot table by `flask archive`; same columns as Post."""
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    content = db.Column(db.Text, nullable=False)
+    date = db.Column(db.DateTime)
+    user_id = db.Column(db.Integer, nullable=False)
+    reply_count = db.Column(db.Integer, nullable=False, default=0)
+    last_reply_at = db.Column(db.DateTime)
+    archived_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+class ReplyArchive(db.Model):
+    """Replies of archived posts; same columns as Reply."""
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    content = db.Column(db.Text, nullable=False)
+    date = db.Column(db.DateTime)
+    post_id = db.Column(db.Integer, nullable=False, index=True)
+    user_id = db.Column(db.Integer, nullable=False)
+    archived_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+class SchemaVersion(db.Model):
+    """One row per applied migration."""
+    version = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    description = db.Column(db.String(200), nullable=False)
+    applied_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+# search_index is not a model (an FTS5 virtual table on SQLite), so create_all()
+# creates it through this hook; see search.py
+@event.listens_for(db.metadata, 'after_create')
+def create_search_index(target, connection, **kw):
+    search.create_schema(connection)
+
 # --- User Loader ---
+class CachedUser(UserMixin):
+    """The fields of User that pages need, restored from the cache.
+
+    It is not attached to the session: write foreign keys with
+    user_id=current_user.id rather than author=current_user.
+    """
+    def __init__(self, id, username, is_admin):
+        self.id = id
+        self.username = username
+        self.is_admin = is_admin
+
+
+def user_cache_key(user_id):
+    return f'user:{user_id}'
+
+
 @login_manager.user_loader
 def load_user(user_id):
-    return db.session.get(User, int(user_id))
+    key = user_cache_key(int(user_id))
+    cached = cache.get(key)
+    if cached is not None:
+        return CachedUser(**json.loads(cached))
+    user = db.session.get(User, int(user_id))
+    if user is not None:
+        fields = {'id': user.id, 'username': user.username, 'is_admin': bool(user.is_admin)}
+        cache.set(key, json.dumps(fields), ttl=app.config['USER_CACHE_TTL'])
+    return user
 
-# --- Base HTML Template ---
-def base_html(title, content):
-    user_section = ''
-    if current_user.is_authenticated:
-        user_section = f'''
-            <div class="flex items-center space-x-4">
-                <span class="text-gray-700 dark:text-gray-300">Привет, {html.escape(current_user.username)}!</span>
-                <a href="{url_for('logout')}" class="text-sm text-blue-600 dark:text-blue-400 hover:underline">Выйти</a>
-            </div>
-        '''
-    else:
-        user_section = f'''
-            <div class="flex items-center space-x-4">
-                <a href="{url_for('login')}" class="text-sm text-blue-600 dark:text-blue-400 hover:underline">Войти</a>
-                <a href="{url_for('register')}" class="text-sm text-blue-600 dark:text-blue-400 hover:underline">Зарегистрироваться</a>
-            </div>
-        '''
-
-    # (Keep the rest of the base_html function as it was)
-    return f'''
-    <!DOCTYPE html>
-    <html lang="ru">
-    <head>
-        <meta charset="UTF-8">
-        <meta name="viewport" content="width=device-width, initial-scale=1.0">
-        <title>{html.escape(title)} - Форум</title>
-        <script src="https://cdn.tailwindcss.com"></script>
-        <script>
-          tailwind.config = {{
-            darkMode: 'media',
-            theme: {{
-              extend: {{
-                colors: {{
-                  background: 'hsl(var(--background))',
-                  foreground: 'hsl(var(--foreground))',
-                  card: 'hsl(var(--card))',
-                  'card-foreground': 'hsl(var(--card-foreground))',
-                  popover: 'hsl(var(--popover))',
-                  'popover-foreground': 'hsl(var(--popover-foreground))',
-                  primary: 'hsl(var(--primary))',
-                  'primary-foreground': 'hsl(var(--primary-foreground))',
-                  secondary: 'hsl(var(--secondary))',
-                  'secondary-foreground': 'hsl(var(--secondary-foreground))',
-                  muted: 'hsl(var(--muted))',
-                  'muted-foreground': 'hsl(var(--muted-foreground))',
-                  accent: 'hsl(var(--accent))',
-                  'accent-foreground': 'hsl(var(--accent-foreground))',
-                  destructive: 'hsl(var(--destructive))',
-                  'destructive-foreground': 'hsl(var(--destructive-foreground))',
-                  border: 'hsl(var(--border))',
-                  input: 'hsl(var(--input))',
-                  ring: 'hsl(var(--ring))',
-                }},
-                borderRadius: {{
-                  lg: 'var(--radius)',
-                  md: 'calc(var(--radius) - 5px)',
-                  sm: 'calc(var(--radius) - 10px)',
-                }},
-              }}
-            }}
-          }}
-        </script>
-        <style type="text/tailwindcss">
-            @layer base {{
-              :root {{
-                --background: 0 0% 100%;
-                --foreground: 222.2 84% 4.9%;
-                --card: 0 0% 100%;
-                --card-foreground: 222.2 84% 4.9%;
-                --popover: 0 0% 100%;
-                --popover-foreground: 222.2 84% 4.9%;
-                --primary: 222.2 47.4% 11.2%;
-                --primary-foreground: 210 40% 98%;
-                --secondary: 210 40% 96.1%;
-                --secondary-foreground: 222.2 47.4% 11.2%;
-                --muted: 210 40% 96.1%;
-                --muted-foreground: 215.4 16.3% 46.9%;
-                --accent: 210 40% 96.1%;
-                --accent-foreground: 222.2 47.4% 11.2%;
-                --destructive: 0 84.2% 60.2%;
-                --destructive-foreground: 210 40% 98%;
-                --border: 214.3 31.8% 91.4%;
-                --input: 214.3 31.8% 91.4%;
-                --ring: 222.2 84% 4.9%;
-                --radius: 2rem;
-              }}
-
-              .dark {{
-                --background: 222.2 84% 4.9%;
-                --foreground: 210 40% 98%;
-                --card: 222.2 84% 4.9%;
-                --card-foreground: 210 40% 98%;
-                --popover: 222.2 84% 4.9%;
-                --popover-foreground: 210 40% 98%;
-                --primary: 210 40% 98%;
-                --primary-foreground: 222.2 47.4% 11.2%;
-                --secondary: 217.2 32.6% 17.5%;
-                --secondary-foreground: 210 40% 98%;
-                --muted: 217.2 32.6% 17.5%;
-                --muted-foreground: 215 20.2% 65.1%;
-                --accent: 217.2 32.6% 17.5%;
-                --accent-foreground: 210 40% 98%;
-                --destructive: 0 62.8% 30.6%;
-                --destructive-foreground: 210 40% 98%;
-                --border: 217.2 32.6% 17.5%;
-                --input: 217.2 32.6% 17.5%;
-                --ring: 212.7 26.8% 83.9%;
-              }}
-            }}
-
-            @layer base {{
-              * {{
-                @apply border-border;
-              }}
-              body {{
-                @apply bg-background text-foreground;
-                font-family: 'Inter', sans-serif; /* Example font */
-              }}
-            }}
-        </style>
-        <link rel="preconnect" href="https://fonts.googleapis.com">
-        <link rel="preconnect" href="https://fonts.gstatic.com" crossorigin>
-        <link href="https://fonts.googleapis.com/css2?family=Inter:wght@400;500;700&display=swap" rel="stylesheet">
-    </head>
-    <body class="bg-background text-foreground min-h-screen antialiased">
-        <div class="max-w-4xl mx-auto p-4 sm:p-6 lg:p-8">
-            <header class="flex justify-between items-center mb-8 pb-4 border-b border-border">
-                 <a href="{url_for('index')}" class="text-2xl font-bold text-primary dark:text-primary-foreground">Форум</a>
-                {user_section}
-            </header>
-            <main>
-                {content}
-            </main>
-            <footer class="mt-12 pt-4 text-center text-sm text-muted-foreground border-t border-border">
-                AnonN (от учеников техноlyceum) &copy; {datetime.utcnow().year}
-            </footer>
-        </div>
-    </body>
-    </html>
-    '''
 
+# Dropped once the change is committed: dropping it at flush time would let a
+# concurrent request cache the old row again until USER_CACHE_TTL runs out
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def invalidate_user(mapper, connection, user):
+    object_session(user).info.setdefault('changed_users', set()).add(user.id)
 
-# --- Routes ---
-@app.route('/')
-def index():
-    posts = Post.query.order_by(Post.date.desc()).all()
-    posts_html_list = []
+@event.listens_for(RoutingSession, 'after_commit')
+def drop_changed_users(db_session):
+    for user_id in db_session.info.pop('changed_users', ()):
+        cache.delete(user_cache_key(user_id))
 
-    for post in posts:
-        # Generate HTML for replies to this post
-        replies_html = ''.join([
-            f'''<div class="ml-6 sm:ml-10 mt-4 p-4 bg-secondary dark:bg-secondary rounded-md border border-border">
-                   <div class="text-xs text-muted-foreground mb-2">
-                       @{html.escape(reply.author.username)} - {reply.date.strftime("%d.%m.%Y %H:%M")}
-                   </div>
-                   <div class="text-sm text-secondary-foreground dark:text-secondary-foreground whitespace-pre-wrap">{html.escape(reply.content)}</div>
-               </div>'''
-            for reply in post.replies
-        ])
-
-        # **FIX:** Generate delete link HTML conditionally beforehand
-        delete_link_html = ''
-        if current_user.is_authenticated and (current_user.is_admin or current_user.id == post.user_id):
-             # Use single quotes inside confirm() to avoid escaping issues with onclick's double quotes
-            delete_link_html = f'''<a href="{url_for("delete_post", post_id=post.id)}"
-                                    onclick="return confirm('Вы уверены, что хотите удалить этот пост?');"
-                                    class="text-red-500 hover:text-red-700 ml-4 text-xs">
-                                    [Удалить пост]
-                                 </a>'''
-
-        # Generate HTML for the post itself, including reply form and replies
-        # Форма ответа (только для авторизованных)
-        reply_form = ''
-        if current_user.is_authenticated:
-            reply_form = f'''
-            <form method="POST" action="{url_for('reply', post_id=post.id)}" class="mt-4">
-                <textarea name="content" required placeholder="Ваш ответ..."
-                        class="w-full p-2 border border-input rounded-md h-24 bg-background dark:bg-input text-foreground dark:text-foreground focus:ring-2 focus:ring-ring focus:border-transparent outline-none resize-none text-sm"></textarea>
-                <button type="submit"
-                        class="mt-2 px-4 py-2 bg-primary text-primary-foreground rounded-md text-sm font-medium hover:bg-primary/90 focus:outline-none focus:ring-2 focus:ring-offset-2 focus:ring-ring dark:bg-primary dark:text-primary-foreground dark:hover:bg-primary/90">
-                    Ответить
-                </button>
-            </form>
-            '''
+@event.listens_for(RoutingSession, 'after_rollback')
+def keep_cached_users(db_session):
+    db_session.info.pop('changed_users', None)
+
+# --- Templates ---
+# Pages live in templates/ and are compiled once at startup below. Jinja keeps
+# compiled templates in its cache (auto-reload only happens in debug mode), so
+# a request only pays for rendering.
+@app.context_processor
+def inject_current_year():
+    return {'current_year': datetime.utcnow().year}
+
+# --- Static Assets ---
+# build_assets.py compiles the stylesheet into assets/dist/ under a content-hashed
+# name (plus .gz / .br variants) and records it in manifest.json. Hashed files
+# never change, so they are served with a one-year immutable Cache-Control.
+ASSETS_DIR = os.path.join(app.root_path, 'assets', 'dist')
+try:
+    with open(os.path.join(ASSETS_DIR, 'manifest.json')) as f:
+        asset_manifest = json.load(f)
+except FileNotFoundError:
+    asset_manifest = {}
+    app.logger.warning("assets/dist/manifest.json not found, pages will be unstyled; run 'python build_assets.py'")
+
+@app.template_global()
+def asset_url(name):
+    """URL of the built, hashed version of asset ``name``, or None if not built."""
+    if name not in asset_manifest:
+        return None
+    return url_for('asset', filename=asset_manifest[name])
+
+@app.route('/assets/<path:filename>')
+def asset(filename):
+    if filename not in asset_manifest.values():
+        abort(404)
+    path, encoding = filename, None
+    # Serve a precompressed variant when the client accepts one
+    for candidate, suffix in (('br', '.br'), ('gzip', '.gz')):
+        if request.accept_encodings[candidate] and os.path.exists(os.path.join(ASSETS_DIR, filename + suffix)):
+            path, encoding = filename + suffix, candidate
+            break
+    response = send_from_directory(ASSETS_DIR, path, mimetype=mimetypes.guess_type(filename)[0],
+                                   max_age=31536000)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+# Part of the feed's ETag, so cached pages are revalidated after a deploy that
+# changes the markup or the stylesheet. Identical in every worker, unlike a
+# per-process token.
+templates_digest = hashlib.sha1(json.dumps(asset_manifest, sort_keys=True).encode('utf-8'))
+for template_name in sorted(app.jinja_env.list_templates()):
+    app.jinja_env.get_template(template_name)
+    templates_digest.update(app.jinja_env.loader.get_source(app.jinja_env, template_name)[0].encode('utf-8'))
+TEMPLATES_DIGEST = templates_digest.hexdigest()[:12]
+
+# --- Feed Pagination ---
+# The feed is paginated by a (date, id) keyset instead of OFFSET, so every page
+# is a single index range scan no matter how deep the reader has scrolled.
+def encode_cursor(post):
+    return f'{post.date.strftime("%Y%m%d%H%M%S%f")}-{post.id}'
+
+# Largest id an INTEGER column holds on Postgres; bigger cursor ids cannot
+# be bound as query parameters (OverflowError on SQLite, DataError on Postgres)
+MAX_CURSOR_ID = 2**31 - 1
+
+def decode_cursor(value):
+    """Parses a feed cursor back into a (date, id) tuple, or None if invalid."""
+    if not value:
+        return None
+    try:
+        date_part, id_part = value.split('-', 1)
+        date, row_id = datetime.strptime(date_part, '%Y%m%d%H%M%S%f'), int(id_part)
+    except ValueError:
+        return None
+    if not 0 <= row_id <= MAX_CURSOR_ID:
+        return None
+    return date, row_id
+
+class FeedPage:
+    """One page of the feed, read from the database while it is being rendered.
+
+    Iterating yields (post, body) pairs newest first, fetched in batches of
+    FEED_STREAM_BATCH rows from a server-side cursor (see render_post_bodies()
+    for the bodies). ``before`` walks towards older posts, ``after`` towards
+    newer ones; both are decoded cursors. newer_cursor and older_cursor are
+    only known once the page has been iterated, so templates render the
+    pagination links after the posts.
+    """
+
+    def __init__(self, before=None, after=None, page_size=None):
+        self.before = before
+        self.after = after
+        self.page_size = page_size or app.config['FEED_PAGE_SIZE']
+        self.newer_cursor = None
+        self.older_cursor = None
+
+    def _query(self):
+        key = db.tuple_(Post.date, Post.id)
+        # Replies are only loaded for posts missing from the fragment cache
+        query = Post.query.options(joinedload(Post.author))
+        if self.after is not None:
+            query = query.filter(key > self.after).order_by(Post.date.asc(), Post.id.asc())
         else:
-            reply_form = '<p class="mt-4 text-sm text-muted-foreground"><a href="/login" class="text-blue-600 dark:text-blue-400 hover:underline">Войдите</a>, чтобы ответить.</p>'
+            if self.before is not None:
+                query = query.filter(key < self.before)
+            query = query.order_by(Post.date.desc(), Post.id.desc())
+        # Fetch one extra row to find out whether another page exists
+        return query.limit(self.page_size + 1)
+
+    def posts(self):
+        """Yields the posts of the page newest first, setting the cursors at the end."""
+        if self.after is not None:
+            # Scanned upwards from the cursor, so this page is buffered and flipped
+            posts = self._query().all()
+            has_newer = len(posts) > self.page_size
+            posts = posts[:self.page_size][::-1]
+            if posts:
+                self.newer_cursor = encode_cursor(posts[0]) if has_newer else None
+                self.older_cursor = encode_cursor(posts[-1])
+            yield from posts
+            return
+
+        first = last = None
+        for index, post in enumerate(self._query().yield_per(app.config['FEED_STREAM_BATCH'])):
+            if index == self.page_size:
+                self.older_cursor = encode_cursor(last)
+                break
+            first = first or post
+            last = post
+            yield post
+        if first is not None and self.before is not None:
+            self.newer_cursor = encode_cursor(first)
+
+    def __iter__(self):
+        batch = []
+        for post in self.posts():
+            batch.append(post)
+            if len(batch) == app.config['FEED_STREAM_BATCH']:
+                yield from self._with_bodies(batch)
+                batch = []
+        yield from self._with_bodies(batch)
+
+    def _with_bodies(self, posts):
+        bodies = render_post_bodies(posts)
+        for post in posts:
+            yield post, bodies[post.id]
+
+
+# --- Fragment Cache ---
+# The viewer-independent part of a post (its text and latest replies) is
+# rendered once and cached under "post:<id>" along with a version derived from
+# its reply columns. _post.html adds the per-viewer parts (delete link, reply
+# form) around it, so anonymous and logged-in visitors share the same cache
+# entries. Write routes drop the entry; the version check also catches writes
+# made through another worker's LocalCache.
+def post_version(post):
+    """Changes whenever a reply is added to or removed from the post."""
+    last_reply_at = post.last_reply_at.isoformat() if post.last_reply_at else ''
+    return f'{post.reply_count}.{last_reply_at}'
+
+def latest_replies(post_ids, limit):
+    """Returns {post_id: [Reply]} with the newest ``limit`` replies of each post, oldest first."""
+    ranked = db.select(
+        Reply.id,
+        db.func.row_number().over(partition_by=Reply.post_id,
+                                  order_by=(Reply.date.desc(), Reply.id.desc())).label('position'),
+    ).where(Reply.post_id.in_(post_ids)).subquery()
+    replies = {post_id: [] for post_id in post_ids}
+    if limit > 0:
+        rows = Reply.query.options(joinedload(Reply.author)) \
+            .join(ranked, ranked.c.id == Reply.id).filter(ranked.c.position <= limit) \
+            .order_by(Reply.date, Reply.id)
+        for reply_obj in rows:
+            replies[reply_obj.post_id].append(reply_obj)
+    return replies
+
+def render_post_bodies(posts):
+    """Returns {post_id: Markup} with the cached body of each post, rendering misses."""
+    bodies, misses = {}, []
+    for post in posts:
+        cached = cache.get(f'post:{post.id}')
+        if cached is not None:
+            version, _, body = cached.partition('\n')
+            if version == post_version(post):
+                bodies[post.id] = Markup(body)
+                continue
+        misses.append(post)
+
+    if misses:
+        # One query for the latest replies (and their authors) of every miss
+        replies = latest_replies([post.id for post in misses], app.config['FEED_REPLIES'])
+        for post in misses:
+            body = render_template('_post_body.html', post=post, replies=replies[post.id])
+            cache.set(f'post:{post.id}', f'{post_version(post)}\n{body}')
+            bodies[post.id] = Markup(body)
+    return bodies
+
+def invalidate_post(post_id):
+    cache.delete(f'post:{post_id}')
+
+
+# --- Conditional Requests ---
+def touch_feed():
+    """Bumps the feed validators; call before committing a write to the feed.
+
+    The feed_state row is created with the schema (stamp_schema() and
+    migration 2), so concurrent writes only ever UPDATE it; the INSERT is a
+    fallback for a row deleted by hand.
+
+    Last-Modified only has whole seconds, so changed_at always moves on to a
+    later second than the previous change; otherwise a second write within
+    the same second would keep the Last-Modified a client already holds and
+    If-Modified-Since would answer 304 for the stale feed.
+    """
+    now = datetime.utcnow()
+    # Locks the row so concurrent writers step the second one after another
+    previous = db.session.execute(
+        db.select(FeedState.changed_at).where(FeedState.id == 1).with_for_update()
+    ).scalar()
+    if previous:
+        now = max(now, previous.replace(microsecond=0) + timedelta(seconds=1))
+    updated = db.session.execute(
+        db.update(FeedState).where(FeedState.id == 1)
+        .values(version=FeedState.version + 1, changed_at=now)
+    ).rowcount
+    if not updated:
+        db.session.add(FeedState(id=1, version=1, changed_at=now))
 
-    # Combine all post HTML strings
-    all_posts_html = ''.join(posts_html_list) if posts_html_list else '<p class="text-center text-muted-foreground">Пока нет сообщений.</p>'
+def feed_validators():
+    """Returns (etag, last_modified) for the feed as seen by the current user."""
+    state = db.session.get(FeedState, 1)
+    version = state.version if state else 0
+    last_modified = state.changed_at.replace(tzinfo=timezone.utc) if state else None
+    # Logged-in pages carry the username and delete links, so they get their own tag
+    viewer = f'u{current_user.id}' if current_user.is_authenticated else 'anon'
+    return f'feed-{TEMPLATES_DIGEST}-{version}-{viewer}', last_modified
 
-    # New Post Form (only if logged in)
-    new_post_form = ''
+def is_not_modified(etag, last_modified):
+    if request.if_none_match:
+        # If-None-Match takes precedence over If-Modified-Since (RFC 9110)
+        return request.if_none_match.contains_weak(etag)
+    if request.if_modified_since and last_modified:
+        return last_modified.replace(microsecond=0) <= request.if_modified_since
+    return False
+
+def set_feed_cache_headers(response, etag, last_modified):
+    response.set_etag(etag, weak=True)
+    if last_modified:
+        # A burst of writes can step changed_at past the clock; never claim a
+        # modification time in the future
+        response.last_modified = min(last_modified, datetime.now(timezone.utc))
     if current_user.is_authenticated:
-        new_post_form = f'''
-        <form method="POST" action="{url_for('create_post')}" class="mb-8 p-5 bg-card dark:bg-card rounded-lg border border-border shadow-sm">
-            <h2 class="text-lg font-semibold text-card-foreground dark:text-card-foreground mb-3">Новое сообщение</h2>
-            <textarea name="content" required placeholder="Напишите что-нибудь..."
-                      class="w-full p-2 border border-input rounded-md h-28 bg-background dark:bg-input text-foreground dark:text-foreground focus:ring-2 focus:ring-ring focus:border-transparent outline-none resize-none text-sm"></textarea>
-            <button type="submit"
-                    class="mt-3 px-5 py-2 bg-primary text-primary-foreground rounded-md text-sm font-medium hover:bg-primary/90 focus:outline-none focus:ring-2 focus:ring-offset-2 focus:ring-ring dark:bg-primary dark:text-primary-foreground dark:hover:bg-primary/90">
-                Опубликовать
-            </button>
-        </form>
-        '''
+        response.headers['Cache-Control'] = 'private, no-cache'
     else:
-         new_post_form = '<p class="mb-8 text-center text-muted-foreground"><a href="/login" class="text-blue-600 dark:text-blue-400 hover:underline">Войдите</a>, чтобы опубликовать сообщение.</p>'
+        response.headers['Cache-Control'] = (
+            f"public, max-age={app.config['FEED_MAX_AGE']}, s-maxage={app.config['FEED_SHARED_MAX_AGE']}"
+        )
+    response.vary.add('Cookie')
+    return response
+
+
+# --- Live Updates ---
+# Writes publish an event through the broker (see events.py); every open
+# /events stream turns it into the freshly rendered _post.html for its own
+# viewer, and assets/src/live.js swaps it into the page. Writes sent by live.js
+# get the same fragment back instead of a redirect to the whole feed.
+def wants_fragment():
+    return request.headers.get('X-Requested-With') == 'fetch'
+
+def render_post(post_id):
+    """Renders one post as it appears in the feed, or returns None if it is gone."""
+    post = Post.query.options(joinedload(Post.author)).filter_by(id=post_id).one_or_none()
+    if post is None:
+        return None
+    return render_template('_post.html', post=post, body=render_post_bodies([post])[post.id])
 
+def sse_event(kind, post_id, html=''):
+    lines = [f'event: {kind}']
+    lines += [f'data: {line}' for line in (html.strip() if html else str(post_id)).splitlines()]
+    return '\n'.join(lines) + '\n\n'
 
-    # Render the full page
-    page_content = f'''
-        {new_post_form}
-        <h2 class="text-xl font-semibold text-foreground dark:text-foreground mb-4">Лента сообщений AnonN:</h2>
-        {all_posts_html}
-    '''
-    return render_template_string(base_html('Главная', page_content))
+def render_event(message):
+    """Renders the post of an event for the current viewer, or returns None if it is gone.
+
+    Every stream of the worker receives the same message, so the fragment
+    anonymous viewers get is rendered once per event and kept on it.
+    """
+    if current_user.is_authenticated:
+        return render_post(message['post_id'])
+    if 'anonymous_html' not in message:
+        message['anonymous_html'] = render_post(message['post_id'])
+    return message['anonymous_html']
+
+def live_events():
+    if not stream_slots.acquire(blocking=False):
+        # This worker already serves its share of streams; try again later
+        yield 'retry: 30000\n\n'
+        return
+    try:
+        with broker.subscribe() as subscription:
+            yield 'retry: 3000\n\n'
+            deadline = time.monotonic() + app.config['SSE_MAX_DURATION']
+            while time.monotonic() < deadline and not subscription.overflowed:
+                message = subscription.get(timeout=app.config['SSE_HEARTBEAT'])
+                if message is None:
+                    yield ': heartbeat\n\n'  # Also notices closed connections
+                    continue
+                kind, post_id = message['type'], message['post_id']
+                html = render_event(message) if kind != 'delete' else ''
+                if html is None:
+                    kind = 'delete'  # Deleted before this stream got to render it
+                yield sse_event(kind, post_id, html)
+                db.session.close()  # Return the connection to the pool between events
+    finally:
+        stream_slots.release()
+
+
+# --- Routes ---
+@app.route('/')
+def index():
+    etag, last_modified = feed_validators()
+    if is_not_modified(etag, last_modified):
+        return set_feed_cache_headers(app.response_class(status=304), etag, last_modified)
+
+    page = FeedPage(
+        before=decode_cursor(request.args.get('before')),
+        after=decode_cursor(request.args.get('after')),
+    )
+    # Streamed: the header goes out before the first post has been read
+    response = app.response_class(stream_template('index.html', page=page))
+    return set_feed_cache_headers(response, etag, last_modified)
 
 
 @app.route('/post', methods=['POST'])
@@ -277,9 +653,15 @@ def index():
 def create_post():
     content = request.form.get('content') # Use .get for safety
     if content: # Basic validation
-        post = Post(content=content, author=current_user)
+        post = Post(content=content, user_id=current_user.id)
         db.session.add(post)
+        db.session.flush()  # Assigns the id and date the search index needs
+        search.add(db.session, 'post', post.id, post.id, post.user_id, post.date, content)
+        broker.publish(db.session, 'post', post.id)
+        touch_feed()
         db.session.commit()
+        if wants_fragment():
+            return render_post(post.id)
     # Add flash messaging later for better feedback
     return redirect(url_for('index'))
 
@@ -290,21 +672,38 @@ def reply(post_id):
     post = db.session.get(Post, post_id) # Check if post exists
     content = request.form.get('content')
     if post and content:
-        reply_obj = Reply(content=content, post_id=post_id, author=current_user)
+        reply_obj = Reply(content=content, post_id=post_id, user_id=current_user.id)
         db.session.add(reply_obj)
+        db.session.flush()
+        search.add(db.session, 'reply', reply_obj.id, post_id, reply_obj.user_id, reply_obj.date, content)
+        # Atomic increment, so concurrent replies cannot lose a count
+        db.session.execute(db.update(Post).where(Post.id == post_id).values(
+            reply_count=Post.reply_count + 1, last_reply_at=reply_obj.date))
+        broker.publish(db.session, 'update', post_id)
+        touch_feed()
         db.session.commit()
+        invalidate_post(post_id)
+        if wants_fragment():
+            return render_post(post_id)
     # Add flash messaging later
     return redirect(url_for('index'))
 
 
 @app.route('/delete_post/<int:post_id>', methods=['GET']) # Changed to GET for link, added confirmation
 @login_required
+@use_primary
 def delete_post(post_id):
     post = db.session.get(Post, post_id)
     if post and (current_user.is_admin or post.user_id == current_user.id):
         # cascade='all, delete-orphan' in Post model handles deleting replies
+        search.remove_post(db.session, post_id, [reply.id for reply in post.replies])
         db.session.delete(post)
+        broker.publish(db.session, 'delete', post_id)
+        touch_feed()
         db.session.commit()
+        invalidate_post(post_id)
+        if wants_fragment():
+            return '', 204
         # Add flash message: "Post deleted"
     else:
         # Add flash message: "Permission denied" or "Post not found"
@@ -312,54 +711,113 @@ def delete_post(post_id):
     return redirect(url_for('index'))
 
 
+@app.route('/delete_reply/<int:reply_id>', methods=['GET'])
+@login_required
+@use_primary
+def delete_reply(reply_id):
+    reply_obj = db.session.get(Reply, reply_id)
+    if reply_obj and (current_user.is_admin or reply_obj.user_id == current_user.id):
+        post_id = reply_obj.post_id
+        db.session.delete(reply_obj)
+        db.session.flush()
+        search.remove_reply(db.session, reply_id)
+        newest = db.select(db.func.max(Reply.date)).where(Reply.post_id == post_id).scalar_subquery()
+        db.session.execute(db.update(Post).where(Post.id == post_id).values(
+            reply_count=Post.reply_count - 1, last_reply_at=newest))
+        broker.publish(db.session, 'update', post_id)
+        touch_feed()
+        db.session.commit()
+        invalidate_post(post_id)
+        if wants_fragment():
+            return '', 204
+    return redirect(request.referrer or url_for('index'))
+
+
+@app.route('/post/<int:post_id>/replies')
+def post_replies(post_id):
+    """All replies of a post, oldest first, REPLIES_PAGE_SIZE per page.
+
+    Returns a page of its own, the bare list for live.js (to expand a thread
+    in the feed) or JSON with ?format=json / Accept: application/json.
+    """
+    post = Post.query.options(joinedload(Post.author)).filter_by(id=post_id).first_or_404()
+    page_size = app.config['REPLIES_PAGE_SIZE']
+    query = Reply.query.options(joinedload(Reply.author)).filter_by(post_id=post_id)
+    after = decode_cursor(request.args.get('after'))
+    if after is not None:
+        query = query.filter(db.tuple_(Reply.date, Reply.id) > after)
+    replies = query.order_by(Reply.date, Reply.id).limit(page_size + 1).all()
+    next_cursor = encode_cursor(replies[page_size - 1]) if len(replies) > page_size else None
+    replies = replies[:page_size]
+
+    if request.args.get('format') == 'json' or \
+            request.accept_mimetypes.best_match(['text/html', 'application/json']) == 'application/json':
+        return {
+            'post_id': post.id,
+            'reply_count': post.reply_count,
+            'replies': [{'id': r.id, 'author': r.author.username, 'date': r.date.isoformat(), 'content': r.content}
+                        for r in replies],
+            'next': url_for('post_replies', post_id=post.id, after=next_cursor, format='json') if next_cursor else None,
+        }
+    template = '_replies.html' if wants_fragment() else 'replies.html'
+    return render_template(template, post=post, replies=replies, next_cursor=next_cursor)
+
+
+@app.route('/events')
+@use_primary  # A lagging replica may not have the post an event is about yet
+def events():
+    response = app.response_class(stream_with_context(live_events()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # Tell proxies not to buffer the stream
+    return response
+
+
+@app.route('/search')
+def search_posts():
+    query = request.args.get('q', '').strip()
+    page = min(max(request.args.get('page', 1, type=int), 1), app.config['SEARCH_MAX_PAGES'])
+    per_page = app.config['SEARCH_PAGE_SIZE']
+    hits, has_next = [], False
+    if query:
+        # One extra row tells whether there is a next page without counting matches
+        hits = search.search(db.session, query, per_page + 1, (page - 1) * per_page)
+        has_next = len(hits) > per_page and page < app.config['SEARCH_MAX_PAGES']
+        hits = hits[:per_page]
+    return render_template('search.html', query=query, hits=hits, page=page, has_next=has_next)
+
+
+def server_busy(template):
+    """503 for when the password hashing queue is full."""
+    response = make_response(render_template(template, error='Сервер перегружен, попробуйте ещё раз через несколько секунд.'), 503)
+    response.headers['Retry-After'] = '2'
+    return response
+
+
 @app.route('/login', methods=['GET', 'POST'])
 def login():
     if current_user.is_authenticated:
         return redirect(url_for('index')) # Redirect if already logged in
 
-    error_message = ''
+    error = None
     if request.method == 'POST':
         username = request.form.get('username')
         password = request.form.get('password')
         user = User.query.filter_by(username=username).first()
 
-        if user and check_password_hash(user.password_hash, password):
+        try:
+            password_ok = user is not None and password_hasher.check(user.password_hash, password or '')
+        except PoolBusy:
+            return server_busy('login.html')
+        if password_ok:
             login_user(user)
             next_page = request.args.get('next') # For redirecting after login
             return redirect(next_page or url_for('index'))
         else:
-            error_message = '<div class="mb-4 p-3 bg-destructive/10 text-destructive rounded-md text-sm">Неверный логин или пароль.</div>'
+            error = 'Неверный логин или пароль.'
             # Consider adding flash messages instead
 
     # Login form using Tailwind classes
-    login_form_html = f'''
-        <div class="max-w-md mx-auto mt-10 p-6 bg-card dark:bg-card rounded-lg border border-border shadow-md">
-            <h2 class="text-2xl font-semibold text-center text-card-foreground dark:text-card-foreground mb-6">Вход</h2>
-            {error_message}
-            <form method="POST" class="space-y-4">
-                <div>
-                    <label for="username" class="block text-sm font-medium text-muted-foreground mb-1">Логин</label>
-                    <input type="text" id="username" name="username" required
-                           class="w-full px-3 py-2 border border-input rounded-md bg-background dark:bg-input text-foreground dark:text-foreground focus:ring-2 focus:ring-ring focus:border-transparent outline-none text-sm"
-                           placeholder="Ваш логин">
-                </div>
-                <div>
-                    <label for="password" class="block text-sm font-medium text-muted-foreground mb-1">Пароль</label>
-                    <input type="password" id="password" name="password" required
-                           class="w-full px-3 py-2 border border-input rounded-md bg-background dark:bg-input text-foreground dark:text-foreground focus:ring-2 focus:ring-ring focus:border-transparent outline-none text-sm"
-                           placeholder="Ваш пароль">
-                </div>
-                <button type="submit"
-                        class="w-full px-4 py-2 bg-primary text-primary-foreground rounded-md font-medium hover:bg-primary/90 focus:outline-none focus:ring-2 focus:ring-offset-2 focus:ring-ring dark:bg-primary dark:text-primary-foreground dark:hover:bg-primary/90">
-                    Войти
-                </button>
-            </form>
-            <p class="mt-6 text-center text-sm text-muted-foreground">
-                Нет аккаунта? <a href="{url_for('register')}" class="text-blue-600 dark:text-blue-400 hover:underline">Зарегистрироваться</a>
-            </p>
-        </div>
-    '''
-    return render_template_string(base_html('Вход', login_form_html))
+    return render_template('login.html', error=error)
 
 
 @app.route('/register', methods=['GET', 'POST'])
@@ -367,18 +825,21 @@ def register():
     if current_user.is_authenticated:
         return redirect(url_for('index')) # Redirect if already logged in
 
-    error_message = ''
+    error = None
     if request.method == 'POST':
         username = request.form.get('username')
         password = request.form.get('password')
 
         # Basic validation (add more robust validation as needed)
         if not username or not password:
-             error_message = '<div class="mb-4 p-3 bg-destructive/10 text-destructive rounded-md text-sm">Логин и пароль обязательны.</div>'
+             error = 'Логин и пароль обязательны.'
         elif User.query.filter_by(username=username).first():
-            error_message = '<div class="mb-4 p-3 bg-destructive/10 text-destructive rounded-md text-sm">Пользователь с таким именем уже существует.</div>'
+            error = 'Пользователь с таким именем уже существует.'
         else:
-            hashed_pw = generate_password_hash(password)
+            try:
+                hashed_pw = password_hasher.generate(password)
+            except PoolBusy:
+                return server_busy('register.html')
             new_user = User(username=username, password_hash=hashed_pw)
             db.session.add(new_user)
             db.session.commit()
@@ -386,34 +847,7 @@ def register():
             return redirect(url_for('login')) # Redirect to login after successful registration
 
     # Registration form using Tailwind classes
-    register_form_html = f'''
-        <div class="max-w-md mx-auto mt-10 p-6 bg-card dark:bg-card rounded-lg border border-border shadow-md">
-            <h2 class="text-2xl font-semibold text-center text-card-foreground dark:text-card-foreground mb-6">Регистрация</h2>
-            {error_message}
-            <form method="POST" class="space-y-4">
-                <div>
-                    <label for="username" class="block text-sm font-medium text-muted-foreground mb-1">Логин</label>
-                    <input type="text" id="username" name="username" required
-                           class="w-full px-3 py-2 border border-input rounded-md bg-background dark:bg-input text-foreground dark:text-foreground focus:ring-2 focus:ring-ring focus:border-transparent outline-none text-sm"
-                           placeholder="Придумайте логин">
-                </div>
-                <div>
-                    <label for="password" class="block text-sm font-medium text-muted-foreground mb-1">Пароль</label>
-                    <input type="password" id="password" name="password" required
-                           class="w-full px-3 py-2 border border-input rounded-md bg-background dark:bg-input text-foreground dark:text-foreground focus:ring-2 focus:ring-ring focus:border-transparent outline-none text-sm"
-                           placeholder="Придумайте пароль">
-                </div>
-                <button type="submit"
-                        class="w-full px-4 py-2 bg-primary text-primary-foreground rounded-md font-medium hover:bg-primary/90 focus:outline-none focus:ring-2 focus:ring-offset-2 focus:ring-ring dark:bg-primary dark:text-primary-foreground dark:hover:bg-primary/90">
-                    Зарегистрироваться
-                </button>
-            </form>
-             <p class="mt-6 text-center text-sm text-muted-foreground">
-                Уже есть аккаунт? <a href="{url_for('login')}" class="text-blue-600 dark:text-blue-400 hover:underline">Войти</a>
-            </p>
-        </div>
-    '''
-    return render_template_string(base_html('Регистрация', register_form_html))
+    return render_template('register.html', error=error)
 
 
 @app.route('/logout')
@@ -424,15 +858,162 @@ def logout():
     return redirect(url_for('index'))
 
 
+@app.route('/admin/metrics')
+def admin_metrics():
+    if instrumentation is None:
+        abort(404)
+    token = app.config['METRICS_TOKEN']
+    authorized_by_token = token and request.headers.get('Authorization') == f'Bearer {token}'
+    if not authorized_by_token and not (current_user.is_authenticated and current_user.is_admin):
+        abort(403)
+    return instrumentation.render_metrics(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+
+# --- Schema Migrations ---
+# db.create_all() only creates missing tables, it never changes existing ones.
+# Changes to existing tables go here as numbered migrations, each applied once
+# in its own transaction and recorded in the schema_version table.
+# Freshly created databases already match the models and are stamped with the
+# latest version instead of running the migrations.
+MIGRATIONS = []
+
+def migration(version, description):
+    """Registers a function taking a connection as schema migration ``version``."""
+    def decorator(func):
+        MIGRATIONS.append((version, description, func))
+        MIGRATIONS.sort(key=lambda m: m[0])
+        return func
+    return decorator
+
+@migration(1, 'Add indexes for the feed, reply lookups and cascade deletes')
+def add_feed_indexes(conn):
+    # IF NOT EXISTS works on both Postgres and SQLite
+    conn.execute(db.text('CREATE INDEX IF NOT EXISTS ix_post_date_id ON post (date, id)'))
+    conn.execute(db.text('CREATE INDEX IF NOT EXISTS ix_post_user_id ON post (user_id)'))
+    conn.execute(db.text('CREATE INDEX IF NOT EXISTS ix_reply_post_id_date ON reply (post_id, date)'))
+    conn.execute(db.text('CREATE INDEX IF NOT EXISTS ix_reply_user_id ON reply (user_id)'))
+
+def recount_replies(conn):
+    """Recomputes post.reply_count and last_reply_at from the reply table."""
+    conn.execute(db.text(
+        'UPDATE post SET'
+        ' reply_count = (SELECT COUNT(*) FROM reply WHERE reply.post_id = post.id),'
+        ' last_reply_at = (SELECT MAX(date) FROM reply WHERE reply.post_id = post.id)'
+    ))
+
+def current_schema_version():
+    if not db.inspect(db.engine).has_table(SchemaVersion.__tablename__):
+        return 0  # Created before migrations existed
+    return db.session.query(db.func.max(SchemaVersion.version)).scalar() or 0
+
+@migration(2, 'Add the feed_state row used for ETag / Last-Modified')
+def add_feed_state(conn):
+    # The table itself comes from db.create_all(); seed its single row from the
+    # newest post or reply so existing feeds get a sensible Last-Modified.
+    changed_at = conn.execute(db.text(
+        'SELECT MAX(d) FROM (SELECT MAX(date) AS d FROM post UNION ALL SELECT MAX(date) FROM reply) AS latest'
+    )).scalar()
+    if isinstance(changed_at, str):  # SQLite returns the raw column text here
+        changed_at = datetime.fromisoformat(changed_at)
+    conn.execute(db.text(
+        'INSERT INTO feed_state (id, version, changed_at) '
+        'SELECT 1, 1, :changed_at WHERE NOT EXISTS (SELECT 1 FROM feed_state WHERE id = 1)'
+    ), {'changed_at': changed_at or datetime.utcnow()})
+
+@migration(3, 'Add the full-text search index over posts and replies')
+def add_search_index(conn):
+    search.create_schema(conn)
+    search.rebuild(conn)
+
+@migration(4, 'Add post.reply_count and post.last_reply_at')
+def add_reply_counters(conn):
+    timestamp = 'TIMESTAMP' if conn.dialect.name == 'postgresql' else 'DATETIME'
+    # db-upgrade runs create_all() first, which already gives a new post table these columns
+    existing = {column['name'] for column in db.inspect(conn).get_columns('post')}
+    if 'reply_count' not in existing:
+        conn.execute(db.text('ALTER TABLE post ADD COLUMN reply_count INTEGER NOT NULL DEFAULT 0'))
+    if 'last_reply_at' not in existing:
+        conn.execute(db.text(f'ALTER TABLE post ADD COLUMN last_reply_at {timestamp}'))
+    recount_replies(conn)
+
+@migration(5, 'Add the feed_state row to databases created without it')
+def seed_feed_state(conn):
+    # Fresh databases used to be stamped past migration 2 without its row, so
+    # the first writes raced to INSERT it
+    add_feed_state(conn)
+
+@migration(6, 'Widen user.password_hash for scrypt hashes')
+def widen_password_hash(conn):
+    # SQLite does not enforce VARCHAR lengths (and cannot ALTER a column type)
+    if conn.dialect.name == 'postgresql':
+        conn.execute(db.text('ALTER TABLE "user" ALTER COLUMN password_hash TYPE VARCHAR(255)'))
+
+def upgrade_schema():
+    """Applies pending migrations in order. Returns the list of versions applied."""
+    applied = []
+    current = current_schema_version()
+    db.session.remove()
+    for version, description, func in MIGRATIONS:
+        if version <= current:
+            continue
+        with db.engine.begin() as conn:
+            disable_statement_timeout(conn)  # Index builds and backfills on big tables take a while
+            func(conn)
+            conn.execute(SchemaVersion.__table__.insert().values(
+                version=version, description=description, applied_at=datetime.utcnow()))
+        applied.append(version)
+    return applied
+
+def stamp_schema():
+    """Marks every known migration as applied without running it.
+
+    Rows the migrations insert are seeded here too.
+    """
+    current = current_schema_version()
+    add_feed_state(db.session.connection())
+    for version, description, _ in MIGRATIONS:
+        if version > current:
+            db.session.add(SchemaVersion(version=version, description=description))
+    db.session.commit()
+
+
 # --- CLI Commands ---
 # These commands can be run via Render's shell or potentially as part of a build script
 @app.cli.command("init-db")
 def init_db():
-    """Creates the database tables based on models."""
+    """Creates the database tables and brings an existing schema up to date."""
     # Wrap in app_context to ensure database connection is available
     with app.app_context():
-        db.create_all()
-    print("Database tables created (if they didn't exist).")
+        fresh = not db.inspect(db.engine).has_table(Post.__tablename__)
+        db.create_all(bind_key=None)  # The primary only; replicas get the schema through replication
+        if fresh:
+            stamp_schema()
+            print("Database tables created.")
+        else:
+            applied = upgrade_schema()
+            print(f"Database tables created (if they didn't exist), applied migrations: {applied or 'none'}.")
+
+@app.cli.command("db-upgrade")
+def db_upgrade():
+    """Applies pending schema migrations to an existing database."""
+    with app.app_context():
+        db.create_all(bind_key=None)  # Tables added since the database was created (primary only)
+        applied = upgrade_schema()
+        if applied:
+            print(f"Applied migrations: {', '.join(map(str, applied))}.")
+        else:
+            print("Database schema is up to date.")
+        print(f"Schema version: {current_schema_version()}")
+
+@app.cli.command("db-version")
+def db_version():
+    """Prints the current schema version and any pending migrations."""
+    with app.app_context():
+        current = current_schema_version()
+        print(f"Schema version: {current}")
+        for version, description, _ in MIGRATIONS:
+            if version > current:
+                print(f"  pending {version}: {description}")
 
 @app.cli.command("create-admin")
 @click.argument("username")
@@ -450,6 +1031,75 @@ def create_admin(username, password):
         db.session.commit()
         print(f"Admin user '{username}' created successfully.")
 
+# Tables moved by export / import, parents first
+EXPORT_TABLES = [('user', User.__table__), ('post', Post.__table__), ('reply', Reply.__table__)]
+
+@app.cli.command("export")
+@click.option("--output", "-o", type=click.File("w", encoding="utf-8"), default="-", help="JSONL file (default: stdout).")
+@click.option("--batch-size", default=1000, show_default=True, help="Rows fetched per round trip.")
+def export_data(output, batch_size):
+    """Streams users, posts and replies out as JSONL."""
+    with app.app_context():
+        counts = bulk.export_jsonl(db.engine, EXPORT_TABLES, output, batch_size)
+    click.echo(f"Exported {dict(counts)}.", err=True)
+
+@app.cli.command("import")
+@click.argument("input", type=click.File("r", encoding="utf-8"))
+@click.option("--batch-size", default=1000, show_default=True, help="Rows inserted per transaction.")
+def import_data(input, batch_size):
+    """Loads a JSONL export into the database; ids are kept, so it must not hold those rows yet."""
+    with app.app_context():
+        counts = bulk.import_jsonl(db.engine, EXPORT_TABLES, input, batch_size)
+        with db.engine.begin() as conn:
+            disable_statement_timeout(conn)
+            bulk.reset_sequences(conn, [table for _, table in EXPORT_TABLES])
+            search.rebuild(conn)
+        touch_feed()
+        db.session.commit()
+    click.echo(f"Imported {dict(counts)}.")
+
+@app.cli.command("archive")
+@click.option("--older-than", type=int, required=True, help="Archive threads with no activity for this many days.")
+@click.option("--output", "-o", type=click.File("w", encoding="utf-8"),
+              help="Write the archived rows to this JSONL file instead of the archive tables.")
+@click.option("--batch-size", default=500, show_default=True, help="Posts moved per transaction.")
+def archive(older_than, output, batch_size):
+    """Moves old posts and their replies out of the hot tables."""
+    cutoff = datetime.utcnow() - timedelta(days=older_than)
+    # Neither the post nor any of its replies is newer than the cutoff
+    stale = db.and_(Post.date < cutoff, db.or_(Post.last_reply_at.is_(None), Post.last_reply_at < cutoff))
+    moved = Counter()
+    with app.app_context():
+        while True:
+            disable_statement_timeout(db.session.connection())  # Once per transaction (batch)
+            post_ids = db.session.scalars(
+                db.select(Post.id).where(stale).order_by(Post.date, Post.id).limit(batch_size)).all()
+            if not post_ids:
+                break
+            reply_ids = db.session.scalars(db.select(Reply.id).where(Reply.post_id.in_(post_ids))).all()
+            if output is not None:
+                for name, table, column in (('post', Post.__table__, Post.id), ('reply', Reply.__table__, Reply.post_id)):
+                    for row in db.session.execute(db.select(table).where(column.in_(post_ids))).mappings():
+                        output.write(bulk.encode_row(name, row) + '\n')
+            else:
+                for source, target, column in ((Post, PostArchive, Post.id), (Reply, ReplyArchive, Reply.post_id)):
+                    names = [c.name for c in source.__table__.columns]
+                    db.session.execute(target.__table__.insert().from_select(
+                        names, db.select(*[source.__table__.c[name] for name in names]).where(column.in_(post_ids))))
+            search.remove_posts(db.session, post_ids, reply_ids)
+            db.session.execute(db.delete(Reply).where(Reply.post_id.in_(post_ids)))
+            db.session.execute(db.delete(Post).where(Post.id.in_(post_ids)))
+            touch_feed()
+            if output is not None:
+                output.flush()  # On disk before the rows are gone from the database
+            db.session.commit()
+            for post_id in post_ids:
+                invalidate_post(post_id)
+            moved['posts'] += len(post_ids)
+            moved['replies'] += len(reply_ids)
+    destination = output.name if output is not None else 'post_archive / reply_archive'
+    click.echo(f"Archived {moved['posts']} posts and {moved['replies']} replies older than {cutoff:%Y-%m-%d} to {destination}.")
+
 # --- Removed the __main__ block ---
 # The application will be run by Gunicorn specified in the Procfile
 # Example: gunicorn app:app
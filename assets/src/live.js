@@ -0,0 +1,117 @@
+// Live feed updates: posts and replies written by anyone show up without a
+// reload (via /events), and this browser's own writes are swapped in from the
+// fragment the server returns instead of re-fetching the whole feed.
+(function () {
+    var feed = document.getElementById('feed');
+    if (!feed) {
+        return;
+    }
+
+    function fragment(html) {
+        var template = document.createElement('template');
+        template.innerHTML = html.trim();
+        return template.content.firstElementChild;
+    }
+
+    function show(html, isNew) {
+        var article = fragment(html);
+        if (!article) {
+            return;
+        }
+        var existing = document.getElementById(article.id);
+        if (existing) {
+            // Keep a reply that is being typed into the old copy
+            var draft = existing.querySelector('textarea');
+            var textarea = article.querySelector('textarea');
+            if (draft && textarea) {
+                textarea.value = draft.value;
+            }
+            // and a thread that has been expanded (the update would collapse it again)
+            var expanded = existing.querySelector('[data-replies][data-expanded]');
+            if (expanded) {
+                article.querySelector('[data-replies]').replaceWith(expanded);
+            }
+            existing.replaceWith(article);
+        } else if (isNew && feed.dataset.newest) {
+            var empty = document.getElementById('feed-empty');
+            if (empty) {
+                empty.remove();
+            }
+            feed.prepend(article);
+        }
+    }
+
+    function remove(postId) {
+        var existing = document.getElementById('post-' + postId);
+        if (existing) {
+            existing.remove();
+        }
+    }
+
+    function send(url, options) {
+        options.headers = {'X-Requested-With': 'fetch'};
+        options.credentials = 'same-origin';
+        return fetch(url, options).then(function (response) {
+            if (response.redirected) {
+                window.location = response.url;  // e.g. to the login page
+                return '';
+            }
+            return response.status === 200 ? response.text() : '';
+        });
+    }
+
+    document.addEventListener('submit', function (e) {
+        var form = e.target;
+        // A new post only appears on the newest page; elsewhere submit normally
+        if (!form.dataset.live || (form.dataset.live === 'post' && !feed.dataset.newest)) {
+            return;
+        }
+        e.preventDefault();
+        send(form.action, {method: 'POST', body: new FormData(form)}).then(function (html) {
+            if (html) {
+                form.reset();
+                show(html, true);
+            }
+        });
+    });
+
+    document.addEventListener('click', function (e) {
+        var link = e.target.closest('a[data-live-delete]');
+        if (!link || e.defaultPrevented) {  // defaultPrevented: confirm() was cancelled
+            return;
+        }
+        e.preventDefault();
+        send(link.href, {method: 'GET'}).then(function () {
+            remove(link.dataset.liveDelete);
+        });
+    });
+
+    // "Show all replies" swaps the thread's latest replies for its first page,
+    // "more" appends the next page in place of the link
+    document.addEventListener('click', function (e) {
+        var link = e.target.closest('a[data-live-replies]');
+        if (!link) {
+            return;
+        }
+        e.preventDefault();
+        send(link.href, {method: 'GET'}).then(function (html) {
+            if (!html) {
+                return;
+            }
+            if (link.dataset.liveReplies === 'all') {
+                var container = link.closest('[data-replies]');
+                container.dataset.expanded = '1';
+                container.innerHTML = html;
+            } else {
+                link.outerHTML = html;
+            }
+        });
+    });
+
+    if (window.EventSource) {
+        var events = new EventSource(feed.dataset.events);
+        events.addEventListener('post', function (e) { show(e.data, true); });
+        events.addEventListener('update', function (e) { show(e.data, false); });
+        events.addEventListener('delete', function (e) { remove(e.data); });
+    }
+})();
@@ -0,0 +1,111 @@
+"""Reads and writes against SQLite at the same time, per journal mode.
+
+Reader threads run the feed query in a loop while writer threads insert
+batches of posts, each in its own transaction. With the rollback journal
+("delete") a commit locks readers out of the whole database; with WAL they
+keep reading the last committed snapshot. Reports reader latency, how much
+work each side got done and any "database is locked" errors:
+
+    python benchmarks/concurrency_bench.py
+    python benchmarks/concurrency_bench.py --modes wal --seconds 10
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import configure_engine, engine_options  # noqa: E402
+from harness import percentile  # noqa: E402
+
+FEED_QUERY = text('SELECT id, content, date FROM post ORDER BY date DESC, id DESC LIMIT 50')
+INSERT_POST = text('INSERT INTO post (content, date, user_id) VALUES (:content, CURRENT_TIMESTAMP, 1)')
+
+
+def run(journal_mode, args):
+    path = os.path.join(tempfile.mkdtemp(), 'concurrency.db')
+    url = f'sqlite:///{path}'
+    engine = create_engine(url, **engine_options(url, sqlite_busy_timeout_ms=args.busy_timeout_ms))
+    configure_engine(engine, sqlite_journal_mode=journal_mode)
+    with engine.begin() as conn:
+        conn.execute(text('CREATE TABLE post (id INTEGER PRIMARY KEY, content TEXT NOT NULL, '
+                          'date DATETIME, user_id INTEGER NOT NULL)'))
+        conn.execute(text('CREATE INDEX ix_post_date_id ON post (date, id)'))
+        conn.execute(INSERT_POST, [{'content': 'x' * 200}] * 10000)
+
+    stop = threading.Event()
+    latencies, writes, errors = [], [0], [0]
+    lock = threading.Lock()
+
+    def reader():
+        while not stop.is_set():
+            start = time.perf_counter()
+            try:
+                with engine.connect() as conn:
+                    conn.execute(FEED_QUERY).fetchall()
+            except OperationalError:
+                with lock:
+                    errors[0] += 1
+                continue
+            with lock:
+                latencies.append(time.perf_counter() - start)
+
+    def writer():
+        while not stop.is_set():
+            try:
+                with engine.begin() as conn:
+                    conn.execute(INSERT_POST, [{'content': 'y' * 200}] * args.batch)
+            except OperationalError:
+                with lock:
+                    errors[0] += 1
+                continue
+            with lock:
+                writes[0] += 1
+
+    threads = ([threading.Thread(target=reader) for _ in range(args.readers)]
+               + [threading.Thread(target=writer) for _ in range(args.writers)])
+    for thread in threads:
+        thread.start()
+    time.sleep(args.seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    engine.dispose()
+
+    latencies.sort()
+    return {
+        'reads/s': len(latencies) / args.seconds,
+        'writes/s': writes[0] / args.seconds,
+        'read p50 ms': percentile(latencies, 0.50) * 1000,
+        'read p99 ms': percentile(latencies, 0.99) * 1000,
+        'read max ms': latencies[-1] * 1000 if latencies else 0.0,
+        'locked errors': errors[0],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--modes', nargs='+', default=['delete', 'wal'])
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--writers', type=int, default=2)
+    parser.add_argument('--batch', type=int, default=200, help='posts inserted per write transaction')
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--busy-timeout-ms', type=int, default=5000)
+    args = parser.parse_args()
+
+    results = {mode: run(mode, args) for mode in args.modes}
+    print(f'{args.readers} readers, {args.writers} writers, {args.seconds:g}s per mode')
+    print(f'{"":16}' + ''.join(f'{mode:>12}' for mode in results))
+    for metric in next(iter(results.values())):
+        print(f'{metric:16}' + ''.join(f'{result[metric]:12.1f}' for result in results.values()))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
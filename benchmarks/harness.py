@@ -0,0 +1,472 @@
+"""Reproducible load test for the forum against a synthetic dataset.
+
+Seed a database once, then run the scenarios against it, either in-process
+through the Flask test client or over HTTP against a real gunicorn:
+
+    python benchmarks/harness.py seed --posts 100000 --replies 500000
+    python benchmarks/harness.py run --mode client
+    python benchmarks/harness.py run --mode gunicorn --workers 4 --concurrency 16
+    python benchmarks/harness.py run --mode gunicorn --worker-class gthread --threads 8
+    python benchmarks/harness.py compare benchmarks/results/a.json benchmarks/results/b.json
+
+Each run reports p50/p95/p99 latency, throughput, SQL queries per request
+(client mode only) and peak RSS per scenario, and is saved as JSON under
+benchmarks/results/ named after the current commit. `compare` exits with
+status 1 when a scenario got slower than --threshold.
+
+The database defaults to benchmarks/bench.db; pass --database-url to use a
+local Postgres instead. Seeded users all have the password "password".
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import resource
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from urllib.parse import urlencode, urlsplit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_DATABASE_URL = 'sqlite:///' + os.path.join(ROOT, 'benchmarks', 'bench.db')
+RESULTS_DIR = os.path.join(ROOT, 'benchmarks', 'results')
+PASSWORD = 'password'
+SCENARIOS = ('feed', 'feed_deep', 'search', 'login', 'register', 'post', 'reply')
+LOGIN_ATTEMPTS = 20
+
+
+def load_app(database_url):
+    """Imports app.py against ``database_url``; must run before any other import of it."""
+    os.environ['DATABASE_URL'] = database_url
+    sys.path.insert(0, ROOT)
+    import app
+    return app
+
+
+# --- Seeding ---
+def seed(args):
+    forum = load_app(args.database_url)
+    from werkzeug.security import generate_password_hash
+
+    rng = random.Random(args.seed)
+    password_hash = generate_password_hash(PASSWORD)  # hashing once keeps seeding fast
+    start = datetime(2024, 1, 1)
+    span = timedelta(days=365).total_seconds()
+
+    def insert(table, rows):
+        forum.db.session.execute(table.insert(), rows)
+
+    def batched(make_row, count):
+        for offset in range(0, count, args.batch_size):
+            yield [make_row(i) for i in range(offset, min(offset + args.batch_size, count))]
+
+    with forum.app.app_context():
+        forum.db.drop_all(bind_key=None)
+        forum.db.create_all(bind_key=None)
+        forum.stamp_schema()
+
+        for rows in batched(lambda i: {'id': i + 1, 'username': f'user{i}', 'password_hash': password_hash,
+                                       'is_admin': False}, args.users):
+            insert(forum.User.__table__, rows)
+        forum.db.session.commit()
+
+        post_dates = sorted(start + timedelta(seconds=rng.random() * span) for _ in range(args.posts))
+        for rows in batched(lambda i: {'id': i + 1, 'content': f'Сообщение {i} ' * rng.randint(1, 40),
+                                       'date': post_dates[i], 'user_id': rng.randint(1, args.users)}, args.posts):
+            insert(forum.Post.__table__, rows)
+            forum.db.session.commit()
+
+        def make_reply(i):
+            post_id = rng.randint(1, args.posts)
+            return {'id': i + 1, 'content': f'Ответ {i} ' * rng.randint(1, 10), 'post_id': post_id,
+                    'user_id': rng.randint(1, args.users),
+                    'date': post_dates[post_id - 1] + timedelta(seconds=rng.randint(1, 86400))}
+
+        for rows in batched(make_reply, args.replies):
+            insert(forum.Reply.__table__, rows)
+            forum.db.session.commit()
+
+        forum.touch_feed()
+        forum.db.session.commit()
+        with forum.db.engine.begin() as conn:
+            forum.recount_replies(conn)
+            forum.search.rebuild(conn)
+        if forum.db.engine.dialect.name == 'postgresql':
+            # Explicit ids leave the sequences behind; let new posts get fresh ones
+            for table in ('user', 'post', 'reply'):
+                forum.db.session.execute(forum.db.text(
+                    f"SELECT setval(pg_get_serial_sequence('\"{table}\"', 'id'), (SELECT MAX(id) FROM \"{table}\"))"))
+            forum.db.session.commit()
+    print(f'Seeded {args.users} users, {args.posts} posts, {args.replies} replies into {args.database_url}')
+
+
+# --- Drivers ---
+def redirects_to(status, location, path):
+    return status in (301, 302, 303) and urlsplit(location or '').path == path
+
+
+def log_in(send):
+    """Logs a seeded user in through ``send(method, path, data) -> (status, location)``.
+
+    Retries while the hashing pool answers 503, and fails loudly unless the
+    login ends with the redirect to the feed: an anonymous "logged-in" client
+    would measure redirects to /login instead of the scenario.
+    """
+    data = {'username': f'user{random.randrange(10)}', 'password': PASSWORD}
+    for attempt in range(LOGIN_ATTEMPTS):
+        status, location = send('POST', '/login', data)
+        if status != 503:
+            break
+        time.sleep(0.05 * (attempt + 1))
+    if not redirects_to(status, location, '/'):
+        raise RuntimeError(f'benchmark login failed: {status} {location or ""}')
+
+
+class ClientDriver:
+    """Runs requests in-process through the Flask test client, counting SQL queries."""
+
+    def __init__(self, forum):
+        self.app = forum.app
+        self.local = threading.local()
+        self.queries = threading.local()
+        from sqlalchemy import event
+        with self.app.app_context():
+            event.listen(forum.db.engine, 'before_cursor_execute', self._count_query)
+
+    def _count_query(self, *args):
+        self.queries.count = getattr(self.queries, 'count', 0) + 1
+
+    def client(self, logged_in):
+        key = 'user' if logged_in else 'anon'
+        client = getattr(self.local, key, None)
+        if client is None:
+            # Anonymous clients drop cookies, so /login and /register never
+            # see an already logged-in session
+            client = self.app.test_client(use_cookies=logged_in)
+            if logged_in:
+                log_in(lambda method, path, data: self._send(client, method, path, data)[:2])
+            setattr(self.local, key, client)
+        return client
+
+    def _send(self, client, method, path, data=None):
+        self.queries.count = 0
+        response = client.open(path, method=method, data=data)
+        response.get_data()  # consume streamed bodies
+        response.close()
+        return response.status_code, response.headers.get('Location'), self.queries.count
+
+    def request(self, method, path, data=None, logged_in=False):
+        """Returns (status, Location header, SQL queries)."""
+        return self._send(self.client(logged_in), method, path, data)
+
+    def peak_rss_kb(self):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class GunicornDriver:
+    """Runs requests over HTTP against a gunicorn serving app:app.
+
+    Settings left as None come from gunicorn.conf.py, i.e. what ships.
+    """
+
+    def __init__(self, database_url, workers=None, worker_class=None, threads=None):
+        with socket.socket() as s:
+            s.bind(('127.0.0.1', 0))
+            self.port = s.getsockname()[1]
+        command = [sys.executable, '-m', 'gunicorn', 'app:app',
+                   '--bind', f'127.0.0.1:{self.port}', '--log-level', 'warning']
+        for option, value in (('--workers', workers), ('--worker-class', worker_class), ('--threads', threads)):
+            if value is not None:
+                command += [option, str(value)]
+        env = dict(os.environ, DATABASE_URL=database_url)
+        self.process = subprocess.Popen(command, cwd=ROOT, env=env)
+        self.local = threading.local()
+        self._wait_until_ready()
+
+    def _wait_until_ready(self, timeout=30):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                with socket.create_connection(('127.0.0.1', self.port), timeout=1):
+                    return
+            except OSError:
+                time.sleep(0.2)
+        self.close()
+        raise RuntimeError('gunicorn did not start')
+
+    def _connection(self, logged_in):
+        key = 'user' if logged_in else 'anon'
+        state = getattr(self.local, key, None)
+        if state is None:
+            state = {'conn': http.client.HTTPConnection('127.0.0.1', self.port), 'cookie': None,
+                     'keep_cookie': logged_in}
+            setattr(self.local, key, state)
+            if logged_in:
+                log_in(lambda method, path, data: self._send(state, method, path, data))
+        return state
+
+    def _send(self, state, method, path, data=None):
+        headers = {}
+        body = None
+        if data is not None:
+            body = urlencode(data)
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        if state['cookie']:
+            headers['Cookie'] = state['cookie']
+        state['conn'].request(method, path, body=body, headers=headers)
+        response = state['conn'].getresponse()
+        response.read()
+        cookie = response.getheader('Set-Cookie')
+        if cookie and state['keep_cookie']:
+            state['cookie'] = cookie.split(';', 1)[0]
+        return response.status, response.getheader('Location')
+
+    def request(self, method, path, data=None, logged_in=False):
+        """Returns (status, Location header, None); SQL queries are not counted over HTTP."""
+        return self._send(self._connection(logged_in), method, path, data) + (None,)
+
+    def peak_rss_kb(self):
+        """Highest peak RSS of the gunicorn master and workers (Linux only)."""
+        pids = [self.process.pid]
+        try:
+            children = f'/proc/{self.process.pid}/task/{self.process.pid}/children'
+            with open(children) as f:
+                pids += [int(pid) for pid in f.read().split()]
+            peaks = []
+            for pid in pids:
+                with open(f'/proc/{pid}/status') as f:
+                    peaks += [int(line.split()[1]) for line in f if line.startswith('VmHWM:')]
+            return max(peaks)
+        except OSError:
+            return None
+
+    def close(self):
+        # SIGINT is gunicorn's quick shutdown; SIGTERM would wait for idle keep-alive connections
+        self.process.send_signal(signal.SIGINT)
+        try:
+            self.process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+
+
+# --- Scenarios ---
+def scenario_requests(name, dataset, rng):
+    """Returns a function producing (method, path, form data, logged_in) for one request."""
+    posts = dataset['posts']
+    if name == 'feed':
+        return lambda: ('GET', '/', None, False)
+    if name == 'feed_deep':
+        # Cursor roughly in the middle of the feed, to show deep pages cost the same
+        cursor = dataset['middle_cursor']
+        return lambda: ('GET', f'/?before={cursor}', None, False)
+    if name == 'search':
+        # Seeded posts read "Сообщение <i>" repeated; pick a number to search for
+        return lambda: ('GET', f'/search?q={rng.randrange(posts)}', None, False)
+    if name == 'login':
+        return lambda: ('POST', '/login', {'username': f'user{rng.randrange(dataset["users"])}',
+                                           'password': PASSWORD}, False)
+    if name == 'register':
+        return lambda: ('POST', '/register', {'username': f'bench-{uuid.uuid4().hex[:12]}',
+                                              'password': PASSWORD}, False)
+    if name == 'post':
+        return lambda: ('POST', '/post', {'content': 'Нагрузочный тест'}, True)
+    if name == 'reply':
+        return lambda: ('POST', f'/reply/{rng.randint(1, posts)}', {'content': 'Ответ из теста'}, True)
+    raise ValueError(f'unknown scenario {name!r}')
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def run_scenario(driver, make_request, requests, concurrency):
+    latencies, queries, errors = [], [], 0
+    lock = threading.Lock()
+
+    def one(_):
+        nonlocal errors
+        method, path, data, logged_in = make_request()
+        start = time.perf_counter()
+        status, location, query_count = driver.request(method, path, data, logged_in)
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+            if query_count is not None:
+                queries.append(query_count)
+            # A logged-in request sent to /login means the session was lost
+            if status >= 400 or (logged_in and redirects_to(status, location, '/login')):
+                errors += 1
+
+    def warm_up(_):
+        one(None)
+        barrier.wait()  # So every pool thread runs one and logs its clients in
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        # Warm up connections, logins and caches outside the measurement
+        barrier = threading.Barrier(concurrency)
+        list(pool.map(warm_up, range(concurrency)))
+        latencies.clear()
+        queries.clear()
+        errors = 0
+
+        started = time.perf_counter()
+        list(pool.map(one, range(requests)))
+        wall = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'requests': requests,
+        'errors': errors,
+        'p50_ms': round(percentile(latencies, 0.50) * 1e3, 3),
+        'p95_ms': round(percentile(latencies, 0.95) * 1e3, 3),
+        'p99_ms': round(percentile(latencies, 0.99) * 1e3, 3),
+        'throughput_rps': round(requests / wall, 1),
+        'queries_per_request': round(sum(queries) / len(queries), 2) if queries else None,
+        'max_queries_per_request': max(queries) if queries else None,
+    }
+
+
+def describe_dataset(forum):
+    with forum.app.app_context():
+        db = forum.db
+        counts = {name: db.session.query(db.func.count(model.id)).scalar()
+                  for name, model in (('users', forum.User), ('posts', forum.Post), ('replies', forum.Reply))}
+        middle = forum.Post.query.order_by(forum.Post.date.desc(), forum.Post.id.desc()) \
+            .offset(counts['posts'] // 2).first()
+        counts['middle_cursor'] = forum.encode_cursor(middle) if middle else ''
+    return counts
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def run(args):
+    forum = load_app(args.database_url)
+    dataset = describe_dataset(forum)
+    if not dataset['posts'] or not dataset['users']:
+        sys.exit("The database is empty; run 'python benchmarks/harness.py seed' first")
+    rng = random.Random(args.seed)
+
+    if args.mode == 'client':
+        driver = ClientDriver(forum)
+    else:
+        driver = GunicornDriver(args.database_url, args.workers, args.worker_class, args.threads)
+
+    results = {}
+    try:
+        for name in args.scenarios.split(','):
+            results[name] = run_scenario(driver, scenario_requests(name, dataset, rng),
+                                         args.requests, args.concurrency)
+            results[name]['peak_rss_kb'] = driver.peak_rss_kb()
+            print(format_row(name, results[name]), flush=True)
+    finally:
+        if isinstance(driver, GunicornDriver):
+            driver.close()
+
+    report = {
+        'commit': git_commit(),
+        'timestamp': datetime.utcnow().isoformat(timespec='seconds') + 'Z',
+        'mode': args.mode,
+        'database': forum.db_url.split(':', 1)[0],
+        'dataset': {key: dataset[key] for key in ('users', 'posts', 'replies')},
+        'concurrency': args.concurrency,
+        'scenarios': results,
+    }
+    output = args.output or os.path.join(
+        RESULTS_DIR, f'{report["commit"]}-{args.mode}-{report["timestamp"].replace(":", "")}.json')
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f'Saved {output}')
+
+
+def format_row(name, result):
+    queries = result['queries_per_request']
+    return (f'{name:<10} p50 {result["p50_ms"]:>8.2f} ms  p95 {result["p95_ms"]:>8.2f} ms  '
+            f'p99 {result["p99_ms"]:>8.2f} ms  {result["throughput_rps"]:>8.1f} req/s  '
+            f'queries {queries if queries is not None else "-":>5}  errors {result["errors"]}  '
+            f'rss {result["peak_rss_kb"] or "-"} KB')
+
+
+# --- Comparison ---
+def compare(args):
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+    print(f'{baseline["commit"]} -> {candidate["commit"]}')
+    for key in ('mode', 'database', 'dataset', 'concurrency'):
+        if baseline.get(key) != candidate.get(key):
+            print(f'warning: {key} differs ({baseline.get(key)} vs {candidate.get(key)})')
+    regressions = []
+    for name, new in candidate['scenarios'].items():
+        old = baseline['scenarios'].get(name)
+        if old is None:
+            continue
+        changes = []
+        for metric in ('p50_ms', 'p95_ms', 'p99_ms', 'queries_per_request'):
+            if old.get(metric) and new.get(metric) is not None:
+                change = (new[metric] - old[metric]) / old[metric]
+                changes.append(f'{metric} {old[metric]} -> {new[metric]} ({change:+.0%})')
+                if metric != 'queries_per_request' and change > args.threshold:
+                    regressions.append(f'{name} {metric}')
+                if metric == 'queries_per_request' and new[metric] > old[metric]:
+                    regressions.append(f'{name} {metric}')
+        print(f'{name:<10} ' + '; '.join(changes))
+    if regressions:
+        print('Regressions: ' + ', '.join(regressions))
+        sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-url', default=os.environ.get('BENCH_DATABASE_URL', DEFAULT_DATABASE_URL))
+    parser.add_argument('--seed', type=int, default=1, help='random seed, for reproducible runs')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    seed_parser = commands.add_parser('seed', help='(re)create the database with synthetic data')
+    seed_parser.add_argument('--users', type=int, default=1000)
+    seed_parser.add_argument('--posts', type=int, default=10000)
+    seed_parser.add_argument('--replies', type=int, default=50000)
+    seed_parser.add_argument('--batch-size', type=int, default=5000)
+    seed_parser.set_defaults(func=seed)
+
+    run_parser = commands.add_parser('run', help='run the scenarios and save a JSON report')
+    run_parser.add_argument('--mode', choices=('client', 'gunicorn'), default='client')
+    run_parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+    run_parser.add_argument('--requests', type=int, default=500, help='requests per scenario')
+    run_parser.add_argument('--concurrency', type=int, default=4)
+    run_parser.add_argument('--workers', type=int, help='gunicorn workers (default: gunicorn.conf.py)')
+    run_parser.add_argument('--worker-class', help='gunicorn worker class (default: gunicorn.conf.py, gevent)')
+    run_parser.add_argument('--threads', type=int, help='gunicorn threads per worker, for gthread')
+    run_parser.add_argument('--output', help='report path (default: benchmarks/results/<commit>-...json)')
+    run_parser.set_defaults(func=run)
+
+    compare_parser = commands.add_parser('compare', help='compare two reports, exit 1 on regressions')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('candidate')
+    compare_parser.add_argument('--threshold', type=float, default=0.10,
+                                help='allowed relative latency increase (default 0.10)')
+    compare_parser.set_defaults(func=compare)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""Feed latency while /login is saturated.
+
+Starts gunicorn against the harness database, measures the feed on its own,
+then again while --login-threads clients hammer /login with valid
+credentials (so every attempt hashes). By default gunicorn runs with the
+gevent workers of gunicorn.conf.py, as deployed; pass --worker-class to
+compare with the old setups:
+
+    python benchmarks/harness.py seed
+    python benchmarks/hashing_bench.py
+    python benchmarks/hashing_bench.py --worker-class sync
+    python benchmarks/hashing_bench.py --worker-class gthread --threads 4
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+
+from harness import DEFAULT_DATABASE_URL, PASSWORD, GunicornDriver, percentile
+
+
+def measure_feed(driver, requests):
+    latencies = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        driver.request('GET', '/')
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    return percentile(latencies, 0.50), percentile(latencies, 0.95), percentile(latencies, 0.99)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-url', default=os.environ.get('BENCH_DATABASE_URL', DEFAULT_DATABASE_URL))
+    parser.add_argument('--workers', type=int, help='gunicorn workers (default: gunicorn.conf.py)')
+    parser.add_argument('--worker-class', help='gunicorn worker class (default: gunicorn.conf.py, gevent)')
+    parser.add_argument('--threads', type=int, help='gunicorn threads per worker, for gthread')
+    parser.add_argument('--login-threads', type=int, default=32)
+    parser.add_argument('--requests', type=int, default=100, help='feed requests per measurement')
+    parser.add_argument('--users', type=int, default=100, help='seeded users to log in as')
+    args = parser.parse_args()
+
+    driver = GunicornDriver(args.database_url, args.workers, args.worker_class, args.threads)
+    try:
+        measure_feed(driver, 10)  # warm up
+        idle = measure_feed(driver, args.requests)
+
+        stop = threading.Event()
+        statuses = []
+
+        def hammer_login():
+            while not stop.is_set():
+                status, _, _ = driver.request('POST', '/login', {'username': f'user{random.randrange(args.users)}',
+                                                              'password': PASSWORD})
+                statuses.append(status)
+
+        attackers = [threading.Thread(target=hammer_login, daemon=True) for _ in range(args.login_threads)]
+        for thread in attackers:
+            thread.start()
+        time.sleep(1)  # let the login queue fill up
+        started = time.perf_counter()
+        loaded = measure_feed(driver, args.requests)
+        elapsed = time.perf_counter() - started
+        stop.set()
+        for thread in attackers:
+            thread.join()
+    finally:
+        driver.close()
+
+    rejected = sum(1 for status in statuses if status == 503)
+    print(f'{args.worker_class or "gevent (gunicorn.conf.py)"} workers={args.workers or "default"} '
+          f'threads={args.threads or "default"}, {args.login_threads} login clients')
+    print(f'{"feed":<14} {"p50":>9} {"p95":>9} {"p99":>9}')
+    for name, (p50, p95, p99) in (('idle', idle), ('logins busy', loaded)):
+        print(f'{name:<14} {p50 * 1e3:>6.1f} ms {p95 * 1e3:>6.1f} ms {p99 * 1e3:>6.1f} ms')
+    print(f'login attempts: {len(statuses)} ({len(statuses) / elapsed:.0f}/s), '
+          f'rejected with 503: {rejected}, median status: {statistics.median(statuses) if statuses else "-"}')
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,92 @@
+"""Time-to-first-byte and peak memory of the feed, buffered vs. streamed.
+
+The buffered variant renders the whole page into one string before sending
+it, as index() did before streaming; the streamed variant is the real route.
+Both go through the full WSGI stack, including compression.
+
+    python benchmarks/stream_bench.py [--posts 500] [--replies 3] [--rounds 20]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+os.environ.setdefault('DATABASE_URL', 'sqlite://')  # seeded below, in memory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import render_template, request  # noqa: E402
+
+from app import app, cache, db, User, Post, Reply, FeedPage, decode_cursor, recount_replies  # noqa: E402
+
+
+def seed(posts, replies):
+    user = User(username='bench', password_hash='x')
+    db.session.add(user)
+    db.session.flush()
+    start = datetime(2024, 1, 1)
+    for i in range(posts):
+        post = Post(content=f'Сообщение номер {i}. ' * 20, user_id=user.id, date=start + timedelta(minutes=i))
+        db.session.add(post)
+        db.session.flush()
+        for j in range(replies):
+            db.session.add(Reply(content=f'Ответ {j}', post_id=post.id, user_id=user.id,
+                                 date=post.date + timedelta(seconds=j)))
+    recount_replies(db.session.connection())
+    db.session.commit()
+
+
+def buffered_index():
+    page = FeedPage(before=decode_cursor(request.args.get('before')),
+                    after=decode_cursor(request.args.get('after')))
+    return render_template('index.html', page=page)
+
+
+def measure(client, rounds, accept_encoding):
+    ttfb, total, peaks, size = [], [], [], 0
+    for _ in range(rounds):
+        cache.clear()
+        tracemalloc.start()
+        start = time.perf_counter()
+        response = client.get('/', headers={'Accept-Encoding': accept_encoding}, buffered=False)
+        chunks = iter(response.response)
+        first = next(chunks)
+        ttfb.append(time.perf_counter() - start)
+        body = first + b''.join(chunks)
+        response.close()
+        total.append(time.perf_counter() - start)
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+        size = len(body)
+    return statistics.median(ttfb), statistics.median(total), max(peaks), size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--posts', type=int, default=500)
+    parser.add_argument('--replies', type=int, default=3)
+    parser.add_argument('--rounds', type=int, default=20)
+    args = parser.parse_args()
+
+    app.config['FEED_PAGE_SIZE'] = args.posts
+    with app.app_context():
+        db.create_all()
+        seed(args.posts, args.replies)
+
+    client = app.test_client()
+    streamed_index = app.view_functions['index']
+    print(f'{args.posts} posts per page, {args.replies} replies each; medians of {args.rounds} rounds')
+    print(f'{"variant":<20} {"ttfb":>10} {"total":>10} {"peak mem":>10} {"bytes":>9}')
+    for encoding in ('identity', 'gzip'):
+        for name, view in (('buffered', buffered_index), ('streamed', streamed_index)):
+            app.view_functions['index'] = view
+            ttfb, total, peak, size = measure(client, args.rounds, encoding)
+            print(f'{name + " " + encoding:<20} {ttfb * 1e3:>7.1f} ms {total * 1e3:>7.1f} ms '
+                  f'{peak / 1024:>7.0f} KB {size:>9}')
+    app.view_functions['index'] = streamed_index
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""Builds the site stylesheet and script into assets/dist/.
+
+Runs the Tailwind CLI over templates/ (see tailwind.config.js) to produce one
+minified stylesheet and copies assets/src/live.js. Each file is named after
+its content hash, with gzip and, if the `brotli` package is installed, brotli
+variants next to it. assets/dist/manifest.json maps logical names ("app.css")
+to the hashed file names; app.py reads it at startup.
+
+    python build_assets.py
+
+Set TAILWIND_CMD to use e.g. the standalone binary instead of npx.
+"""
+import gzip
+import hashlib
+import json
+import os
+import shlex
+import subprocess
+import sys
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+SOURCE = os.path.join(ROOT, 'assets', 'src', 'app.css')
+SCRIPTS = ('live.js',)
+DIST = os.path.join(ROOT, 'assets', 'dist')
+MANIFEST = os.path.join(DIST, 'manifest.json')
+TAILWIND_CMD = os.environ.get('TAILWIND_CMD', 'npx --yes tailwindcss@3')
+
+
+def compile_css():
+    command = shlex.split(TAILWIND_CMD) + [
+        '--config', os.path.join(ROOT, 'tailwind.config.js'),
+        '--input', SOURCE,
+        '--minify',
+    ]
+    result = subprocess.run(command, cwd=ROOT, check=True, stdout=subprocess.PIPE)
+    return result.stdout
+
+
+def write(path, data):
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def build(logical_name, data):
+    """Writes ``data`` and its compressed variants under a hashed name; returns the name."""
+    stem, ext = os.path.splitext(logical_name)
+    name = f'{stem}.{hashlib.sha256(data).hexdigest()[:12]}{ext}'
+
+    # Only the current build is kept; hashed names never change content
+    for old in os.listdir(DIST):
+        if old.startswith(stem + '.') and not old.startswith(name):
+            os.remove(os.path.join(DIST, old))
+
+    write(os.path.join(DIST, name), data)
+    write(os.path.join(DIST, name + '.gz'), gzip.compress(data, compresslevel=9, mtime=0))
+    if brotli is not None:
+        write(os.path.join(DIST, name + '.br'), brotli.compress(data, quality=11))
+    print(f'Built assets/dist/{name} ({len(data)} bytes)')
+    return name
+
+
+def main():
+    os.makedirs(DIST, exist_ok=True)
+    if brotli is None:
+        print('brotli is not installed, skipping the .br variants', file=sys.stderr)
+
+    manifest = {'app.css': build('app.css', compile_css())}
+    for script in SCRIPTS:
+        with open(os.path.join(ROOT, 'assets', 'src', script), 'rb') as f:
+            manifest[script] = build(script, f.read())
+
+    with open(MANIFEST, 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
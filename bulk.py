@@ -0,0 +1,137 @@
+"""Streaming JSONL export and import of whole tables.
+
+Every line is one row: {"type": "<table>", "<column>": <value>, ...}, with
+datetimes as ISO 8601 strings. Tables are written parent first (users,
+posts, replies), so a file can be imported in a single pass.
+
+Memory stays constant in both directions: export reads through a
+server-side cursor (stream_results) ``batch_size`` rows at a time, and
+import commits every ``batch_size`` rows, using COPY on Postgres and
+executemany elsewhere.
+
+    with open('forum.jsonl', 'w') as out:
+        export_jsonl(engine, [('user', User.__table__), ...], out)
+    with open('forum.jsonl') as lines:
+        import_jsonl(engine, [('user', User.__table__), ...], lines)
+"""
+from collections import Counter
+from datetime import datetime
+import io
+import json
+
+from sqlalchemy import DateTime, func, select, text
+
+from database import disable_statement_timeout
+
+
+def encode_row(name, row):
+    """One exported JSONL line (without the newline) for a row mapping."""
+    record = {'type': name}
+    for key, value in row.items():
+        record[key] = value.isoformat() if isinstance(value, datetime) else value
+    return json.dumps(record, ensure_ascii=False)
+
+
+def decode_row(table, record):
+    """Turns an imported record back into column values for ``table``."""
+    row = {}
+    for column in table.columns:
+        value = record.get(column.name)
+        if value is not None and isinstance(column.type, DateTime):
+            value = datetime.fromisoformat(value)
+        row[column.name] = value
+    return row
+
+
+def export_jsonl(engine, tables, out, batch_size=1000):
+    """Writes every row of ``tables`` ((name, Table) pairs) to ``out``. Returns counts per name."""
+    counts = Counter()
+    for name, table in tables:
+        with engine.connect() as conn:
+            disable_statement_timeout(conn)
+            result = conn.execution_options(stream_results=True, yield_per=batch_size).execute(
+                select(table).order_by(*table.primary_key.columns))
+            for row in result.mappings():
+                out.write(encode_row(name, row) + '\n')
+                counts[name] += 1
+    return counts
+
+
+def import_jsonl(engine, tables, lines, batch_size=1000):
+    """Inserts the rows read from ``lines``, one transaction per batch. Returns counts per name."""
+    tables = dict(tables)
+    counts = Counter()
+    batch, current = [], None
+
+    def flush():
+        if batch:
+            with engine.begin() as conn:
+                disable_statement_timeout(conn)
+                insert_rows(conn, tables[current], batch)
+            counts[current] += len(batch)
+            batch.clear()
+
+    for line in lines:
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        name = record.pop('type')
+        if name not in tables:
+            raise ValueError(f'unknown row type {name!r}')
+        if name != current:
+            flush()
+            current = name
+        batch.append(decode_row(tables[name], record))
+        if len(batch) >= batch_size:
+            flush()
+    flush()
+    return counts
+
+
+def insert_rows(conn, table, rows):
+    if conn.dialect.name == 'postgresql':
+        _copy_rows(conn, table, rows)
+    else:
+        conn.execute(table.insert(), rows)
+
+
+def _copy_value(value):
+    # COPY's text format: \N is NULL, and backslash, tab and newlines are escaped
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+
+def _copy_rows(conn, table, rows):
+    preparer = conn.dialect.identifier_preparer
+    columns = [column.name for column in table.columns]
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write('\t'.join(_copy_value(row[name]) for name in columns) + '\n')
+    buffer.seek(0)
+    statement = 'COPY {} ({}) FROM STDIN'.format(
+        preparer.format_table(table), ', '.join(preparer.quote(name) for name in columns))
+    # psycopg2's cursor on the connection SQLAlchemy has already opened for this transaction
+    cursor = conn.connection.cursor()
+    try:
+        cursor.copy_expert(statement, buffer)
+    finally:
+        cursor.close()
+
+
+def reset_sequences(conn, tables):
+    """After inserting explicit ids on Postgres, moves each id sequence past the largest id."""
+    if conn.dialect.name != 'postgresql':
+        return
+    preparer = conn.dialect.identifier_preparer
+    for table in tables:
+        if conn.execute(select(func.count()).select_from(table)).scalar() == 0:
+            continue
+        quoted = preparer.format_table(table)
+        conn.execute(text(
+            f"SELECT setval(pg_get_serial_sequence(:table, 'id'), (SELECT MAX(id) FROM {quoted}))"
+        ), {'table': quoted})
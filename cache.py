@@ -0,0 +1,88 @@
+"""Small key/value caches used for rendered fragments and other hot data.
+
+Two backends share the same interface (get / set / delete):
+
+* LocalCache keeps values in the worker's memory with LRU eviction. It needs
+  nothing extra, but every gunicorn worker holds its own copy.
+* RedisCache stores values in Redis, so all workers (and all instances) share
+  one warm cache and see each other's invalidations. Needs the `redis` package.
+
+Use make_cache() to pick one from a URL.
+"""
+from collections import OrderedDict
+import threading
+import time
+
+
+class LocalCache:
+    """In-process LRU cache holding at most ``max_entries`` values."""
+
+    def __init__(self, max_entries=5000):
+        self.max_entries = max_entries
+        self._data = OrderedDict()  # key -> (expires_at or None, value)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class RedisCache:
+    """Cache shared between processes through a Redis server.
+
+    Values are stored as UTF-8 strings under ``prefix``; eviction is left to
+    Redis' own ``maxmemory-policy`` (use ``allkeys-lru``).
+    """
+
+    def __init__(self, url, prefix='anonn:'):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("A redis:// cache URL needs the 'redis' package (pip install redis)")
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url)
+
+    def get(self, key):
+        value = self._client.get(self.prefix + key)
+        return value.decode('utf-8') if value is not None else None
+
+    def set(self, key, value, ttl=None):
+        self._client.set(self.prefix + key, value.encode('utf-8'), ex=ttl)
+
+    def delete(self, key):
+        self._client.delete(self.prefix + key)
+
+    def clear(self):
+        for key in self._client.scan_iter(self.prefix + '*'):
+            self._client.delete(key)
+
+
+def make_cache(url=None, max_entries=5000):
+    """Returns a RedisCache for redis:// URLs and a LocalCache otherwise."""
+    if url and url.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisCache(url)
+    return LocalCache(max_entries)
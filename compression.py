@@ -0,0 +1,144 @@
+"""WSGI middleware compressing responses on the fly with brotli or gzip.
+
+The encoding is negotiated from Accept-Encoding (brotli first when the
+`brotli` package is installed). Streamed responses are compressed chunk by
+chunk and flushed every ``flush_size`` bytes of input, so the client keeps
+receiving data while the page is still being rendered. Responses that are
+already encoded (e.g. precompressed assets), too small, or of a type that
+does not compress well are passed through untouched.
+"""
+import zlib
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_TYPES = (
+    'text/',
+    'application/json',
+    'application/javascript',
+    'application/xml',
+    'image/svg+xml',
+)
+# Every chunk of these must reach the client as soon as it is written
+UNBUFFERED_TYPES = ('text/event-stream',)
+
+
+class GzipEncoder:
+    name = 'gzip'
+
+    def __init__(self, level):
+        # wbits=31 writes a gzip header and trailer
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def flush(self):
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+class BrotliEncoder:
+    name = 'br'
+
+    def __init__(self, level):
+        # Brotli's quality scale is 0-11; mid-range levels are fast enough for
+        # on-the-fly use, unlike the 11 used for the prebuilt assets
+        self._compressor = brotli.Compressor(quality=min(level, 11))
+
+    def compress(self, data):
+        return self._compressor.process(data)
+
+    def flush(self):
+        return self._compressor.flush()
+
+    def finish(self):
+        return self._compressor.finish()
+
+
+def choose_encoder(accept_encoding):
+    """Returns the encoder class to use for an Accept-Encoding header, or None."""
+    accepted = {}
+    for item in accept_encoding.split(','):
+        coding, _, params = item.strip().partition(';')
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[coding.strip().lower()] = quality
+    if brotli is not None and accepted.get('br', 0) > 0:
+        return BrotliEncoder
+    if accepted.get('gzip', accepted.get('*', 0)) > 0:
+        return GzipEncoder
+    return None
+
+
+class CompressionMiddleware:
+    def __init__(self, app, level=5, min_size=500, flush_size=8192):
+        self.app = app
+        self.level = level
+        self.min_size = min_size
+        self.flush_size = flush_size
+
+    def __call__(self, environ, start_response):
+        encoder_class = choose_encoder(environ.get('HTTP_ACCEPT_ENCODING', ''))
+        if encoder_class is None or environ.get('REQUEST_METHOD') == 'HEAD':
+            return self.app(environ, start_response)
+
+        state = {}
+
+        def compressing_start_response(status, headers, exc_info=None):
+            if self._should_compress(status, headers):
+                state['encoder'] = encoder_class(self.level)
+                headers = [(k, v) for k, v in headers if k.lower() != 'content-length']
+                headers.append(('Content-Encoding', encoder_class.name))
+                vary = [v for k, v in headers if k.lower() == 'vary']
+                headers = [(k, v) for k, v in headers if k.lower() != 'vary']
+                headers.append(('Vary', ', '.join(vary + ['Accept-Encoding'])))
+            return start_response(status, headers, exc_info)
+
+        app_iter = self.app(environ, compressing_start_response)
+        return self._iter_compressed(app_iter, state)
+
+    def _should_compress(self, status, headers):
+        if not status.startswith('200'):
+            return False
+        headers = {k.lower(): v for k, v in headers}
+        if 'content-encoding' in headers:
+            return False
+        content_type = headers.get('content-type', '')
+        if not content_type.startswith(COMPRESSIBLE_TYPES) or content_type.startswith(UNBUFFERED_TYPES):
+            return False
+        length = headers.get('content-length')
+        # No Content-Length means a streamed body, which is worth compressing
+        return length is None or int(length) >= self.min_size
+
+    def _iter_compressed(self, app_iter, state):
+        try:
+            pending = 0
+            for chunk in app_iter:
+                encoder = state.get('encoder')
+                if encoder is None:
+                    yield chunk
+                    continue
+                data = encoder.compress(chunk)
+                pending += len(chunk)
+                if pending >= self.flush_size:
+                    # Push what we have so far to the client
+                    data += encoder.flush()
+                    pending = 0
+                if data:
+                    yield data
+            encoder = state.get('encoder')
+            if encoder is not None:
+                yield encoder.finish()
+        finally:
+            if hasattr(app_iter, 'close'):
+                app_iter.close()
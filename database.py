@@ -0,0 +1,59 @@
+"""Engine setup for the databases the forum runs on.
+
+Postgres gets a bounded connection pool per worker, pre-ping (so connections
+the server or a proxy dropped are replaced instead of failing a request),
+recycling and a server-side statement timeout. The timeout is meant for web
+requests; maintenance work (migrations, imports, archiving) lifts it with
+disable_statement_timeout().
+
+SQLite gets WAL journaling, so readers keep reading while a write is in
+progress, synchronous=NORMAL (safe with WAL and much cheaper than FULL) and
+a busy timeout, so a second writer waits for the lock instead of failing
+with "database is locked".
+
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(url, pool_size=4, ...)
+    configure_engine(db.engine)
+"""
+from sqlalchemy import event, text
+
+
+def engine_options(url, pool_size=4, max_overflow=2, pool_timeout=10, pool_recycle=1800,
+                   statement_timeout_ms=5000, sqlite_busy_timeout_ms=5000):
+    """Returns create_engine() keyword arguments for ``url``."""
+    if url.startswith('sqlite'):
+        # sqlite3's timeout is its busy handler: how long to wait for a lock
+        return {'connect_args': {'timeout': sqlite_busy_timeout_ms / 1000}}
+
+    options = {
+        'pool_size': pool_size,
+        'max_overflow': max_overflow,
+        'pool_timeout': pool_timeout,
+        'pool_recycle': pool_recycle,
+        'pool_pre_ping': True,
+    }
+    if url.startswith('postgresql') and statement_timeout_ms:
+        options['connect_args'] = {'options': f'-c statement_timeout={int(statement_timeout_ms)}'}
+    return options
+
+
+def disable_statement_timeout(conn):
+    """Lifts the statement timeout until ``conn``'s transaction ends; a no-op except on Postgres."""
+    if conn.dialect.name == 'postgresql':
+        conn.execute(text('SET LOCAL statement_timeout = 0'))
+
+
+def configure_engine(engine, sqlite_journal_mode='wal', sqlite_synchronous='normal'):
+    """Sets the per-connection SQLite pragmas; a no-op for other databases.
+
+    Call it before the engine opens its first connection.
+    """
+    if engine.dialect.name != 'sqlite':
+        return
+
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        # The journal mode is stored in the database file; synchronous is per connection
+        cursor.execute(f'PRAGMA journal_mode={sqlite_journal_mode}')
+        cursor.execute(f'PRAGMA synchronous={sqlite_synchronous}')
+        cursor.close()
@@ -0,0 +1,149 @@
+"""Fan-out of feed events to Server-Sent Events streams.
+
+A write publishes a small event ({"type": "post" | "update" | "delete",
+"post_id": ...}) inside its transaction; every open /events stream gets it
+once the transaction commits.
+
+* PostgresBroker sends events with pg_notify, so they reach the streams of
+  every gunicorn worker (and every instance) connected to the database. Each
+  worker keeps one extra connection LISTENing on a background thread.
+* LocalBroker delivers within the current process only. That is enough for
+  a single worker (local development on SQLite); with several workers a
+  stream only sees writes handled by its own worker.
+
+    broker = make_broker(db.engine)
+    broker.publish(db.session, 'post', post.id)    # before commit
+    with broker.subscribe() as events:
+        event = events.get(timeout=15)             # None on timeout
+"""
+from contextlib import contextmanager
+import json
+import logging
+import queue
+import select
+import threading
+import time
+
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = 'forum_events'
+
+
+class Subscription:
+    """Events for one stream; dropped by the broker when the stream falls behind."""
+
+    def __init__(self, max_pending):
+        self._queue = queue.Queue(max_pending)
+        self.overflowed = False
+
+    def put(self, payload):
+        try:
+            self._queue.put_nowait(payload)
+        except queue.Full:
+            self.overflowed = True
+
+    def get(self, timeout):
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class LocalBroker:
+    def __init__(self, max_pending=100):
+        self.max_pending = max_pending
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._info_key = f'events_{id(self)}'
+        event.listen(Session, 'after_commit', self._after_commit)
+        event.listen(Session, 'after_rollback', self._after_rollback)
+
+    @contextmanager
+    def subscribe(self):
+        subscription = Subscription(self.max_pending)
+        with self._lock:
+            self._subscribers.add(subscription)
+        self._started()
+        try:
+            yield subscription
+        finally:
+            with self._lock:
+                self._subscribers.discard(subscription)
+
+    def _started(self):
+        pass
+
+    def dispatch(self, payload):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            subscription.put(payload)
+
+    def publish(self, session, kind, post_id):
+        """Queues an event that is delivered when the session's transaction commits."""
+        session.info.setdefault(self._info_key, []).append({'type': kind, 'post_id': post_id})
+
+    def _after_commit(self, session):
+        for payload in session.info.pop(self._info_key, ()):
+            self.dispatch(payload)
+
+    def _after_rollback(self, session):
+        session.info.pop(self._info_key, None)
+
+
+class PostgresBroker(LocalBroker):
+    def __init__(self, engine, max_pending=100, reconnect_delay=2):
+        super().__init__(max_pending)
+        self.engine = engine
+        self.reconnect_delay = reconnect_delay
+        self._listener = None
+
+    def publish(self, session, kind, post_id):
+        # NOTIFY is transactional: it is sent on commit and dropped on rollback
+        session.execute(text('SELECT pg_notify(:channel, :payload)'),
+                        {'channel': CHANNEL, 'payload': json.dumps({'type': kind, 'post_id': post_id})})
+
+    def _started(self):
+        # One listener thread per process, started by the first stream (after the gunicorn fork)
+        with self._lock:
+            if self._listener is None or not self._listener.is_alive():
+                self._listener = threading.Thread(target=self._listen, name='events-listener', daemon=True)
+                self._listener.start()
+
+    def _listen(self):
+        while True:
+            try:
+                self._listen_once()
+            except Exception:
+                logger.exception('Event listener lost its connection, reconnecting')
+            time.sleep(self.reconnect_delay)
+
+    def _listen_once(self):
+        # A dedicated connection, detached so it does not hold a pool slot, in
+        # autocommit mode as LISTEN requires
+        connection = self.engine.raw_connection()
+        connection.detach()
+        try:
+            dbapi_connection = connection.dbapi_connection
+            dbapi_connection.autocommit = True
+            cursor = dbapi_connection.cursor()
+            cursor.execute(f'LISTEN {CHANNEL}')
+            while True:
+                if select.select([dbapi_connection], [], [], 60) == ([], [], []):
+                    continue
+                dbapi_connection.poll()
+                while dbapi_connection.notifies:
+                    notify = dbapi_connection.notifies.pop(0)
+                    self.dispatch(json.loads(notify.payload))
+        finally:
+            connection.close()
+
+
+def make_broker(engine, max_pending=100):
+    """PostgresBroker for a Postgres engine, LocalBroker otherwise."""
+    if engine.dialect.name == 'postgresql':
+        return PostgresBroker(engine, max_pending)
+    return LocalBroker(max_pending)
@@ -0,0 +1,26 @@
+"""gunicorn settings, read from ./gunicorn.conf.py by `gunicorn app:app`.
+
+Workers are gevent-based: each request runs in a greenlet rather than a
+thread, so an open /events stream (see live_events() in app.py) costs a few
+kilobytes and one worker holds hundreds of them next to ordinary page
+requests. Options given on the command line override these.
+"""
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', 4))
+worker_class = 'gevent'
+# Open connections per worker: pages, logins and /events streams together
+worker_connections = int(os.environ.get('WORKER_CONNECTIONS', 1000))
+
+
+def post_fork(server, worker):
+    if server.cfg.worker_class_str != 'gevent':
+        return
+    # psycopg2 waits for Postgres inside C code, which would block every
+    # greenlet of the worker; patched, it yields to the other greenlets
+    try:
+        from psycogreen.gevent import patch_psycopg
+        patch_psycopg()
+    except ImportError:
+        pass  # No psycopg2 (local SQLite), nothing to patch
@@ -0,0 +1,111 @@
+"""Bounded pool for password hashing.
+
+Hashing a password deliberately costs tens to hundreds of milliseconds of
+CPU. Running it inline lets a burst of logins (or a credential-stuffing run)
+occupy every request thread. PasswordHasher runs the work on a small pool
+and admits at most ``max_workers + max_queue`` jobs at once; anything beyond
+that is rejected immediately with PoolBusy so the caller can answer 503
+instead of queueing.
+
+The default thread pool is enough because hashlib's scrypt and PBKDF2
+release the GIL while hashing, so other request threads keep running. Use
+kind='process' to move hashing out of the worker process entirely.
+
+Under gevent (gunicorn.conf.py), where threads are patched into greenlets, a
+hash would block every request of the worker; the pool then uses gevent's
+real threads instead.
+
+Pool threads (or processes) also run at a lower CPU priority (``nice``), so
+when cores are scarce the scheduler serves page requests before hashing.
+"""
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError as FutureTimeout
+import os
+import sys
+import threading
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+
+class PoolBusy(Exception):
+    """Raised when the hashing queue is full, or a hash did not finish within ``timeout``."""
+
+
+def _lower_priority(nice):
+    """Pool initializer: lowers the CPU priority of the calling thread or process."""
+    try:
+        # On Linux a thread is its own scheduling entity, so this only affects
+        # the pool thread (or the pool process' main thread)
+        os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), nice)
+    except (AttributeError, OSError):
+        pass  # Not supported on this platform; hashing runs at normal priority
+
+
+def _gevent_patched():
+    monkey = sys.modules.get('gevent.monkey')
+    return monkey is not None and monkey.is_module_patched('threading')
+
+
+def _call_at_lower_priority(nice, func, *args):
+    # gevent's pool has no initializer; setting the priority again per call is cheap
+    _lower_priority(nice)
+    return func(*args)
+
+
+class PasswordHasher:
+    def __init__(self, max_workers=2, max_queue=8, kind='thread', timeout=30, nice=10):
+        if kind not in ('thread', 'process'):
+            raise ValueError(f"kind must be 'thread' or 'process', not {kind!r}")
+        self.max_workers = max_workers
+        self.kind = kind
+        self.timeout = timeout
+        self.nice = nice
+        self._slots = threading.BoundedSemaphore(max_workers + max_queue)
+        self._executor = None
+        self._gevent = False
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        # Created on first use so each gunicorn worker gets its own pool after fork
+        with self._lock:
+            if self._executor is None:
+                if self.kind == 'thread' and _gevent_patched():
+                    from gevent.threadpool import ThreadPoolExecutor as NativeThreadPoolExecutor
+                    self._executor = NativeThreadPoolExecutor(self.max_workers)
+                    self._gevent = True
+                elif self.kind == 'process':
+                    self._executor = ProcessPoolExecutor(self.max_workers, initializer=_lower_priority,
+                                                         initargs=(self.nice,))
+                else:
+                    self._executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix='password-hash',
+                                                        initializer=_lower_priority, initargs=(self.nice,))
+            return self._executor
+
+    def _run(self, func, *args):
+        if not self._slots.acquire(blocking=False):
+            raise PoolBusy()
+        try:
+            executor = self._get_executor()
+            if self._gevent:
+                future = executor.submit(_call_at_lower_priority, self.nice, func, *args)
+            else:
+                future = executor.submit(func, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            raise PoolBusy() from None
+
+    def generate(self, password):
+        return self._run(generate_password_hash, password)
+
+    def check(self, password_hash, password):
+        return self._run(check_password_hash, password_hash, password)
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
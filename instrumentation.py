@@ -0,0 +1,212 @@
+"""Opt-in per-request instrumentation for Flask + SQLAlchemy.
+
+For every request it records the number of SQL queries, the time spent in
+SQL, in template rendering and in total, and aggregates them per endpoint.
+Along the way it logs slow queries and statements repeated within one
+request (the N+1 pattern), and can dump a cProfile of a sampled fraction of
+requests. render_metrics() returns the aggregates in the Prometheus text
+format.
+
+Metrics are per process: with several gunicorn workers each one reports its
+own counters, so scrape them through a load balancer repeatedly or sum them.
+
+    instrumentation = Instrumentation(app)
+"""
+from collections import Counter, defaultdict
+import cProfile
+import os
+import random
+import re
+import threading
+import time
+
+from flask import g, has_app_context, request, before_render_template, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Upper bounds (seconds) of the request duration histogram
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Collapses "IN (?, ?, ?)" style parameter lists so batches of different sizes
+# count as the same statement
+_PARAMS_RE = re.compile(r'\((?:\s*(?:\?|%\(\w+\)s|%s|:\w+)\s*,?)+\)')
+
+
+def normalize_statement(statement):
+    return _PARAMS_RE.sub('(?)', ' '.join(statement.split()))
+
+
+class RequestStats:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.sql_time = 0.0
+        self.render_time = 0.0
+        self.render_started = None
+        self.sql_time_at_render = 0.0
+        self.statements = Counter()
+        self.profiler = None
+
+
+class EndpointStats:
+    def __init__(self):
+        self.requests = Counter()  # (method, status) -> count
+        self.duration_sum = 0.0
+        self.buckets = [0] * len(DURATION_BUCKETS)
+        self.queries = 0
+        self.sql_time = 0.0
+        self.render_time = 0.0
+        self.n_plus_one = 0
+
+
+class Instrumentation:
+    def __init__(self, app=None):
+        self._endpoints = defaultdict(EndpointStats)
+        self._slow_queries = 0
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('SLOW_QUERY_MS', 100)
+        app.config.setdefault('N_PLUS_ONE_THRESHOLD', 20)
+        app.config.setdefault('PROFILE_SAMPLE_RATE', 0.0)
+        app.config.setdefault('PROFILE_DIR', 'profiles')
+        self.app = app
+
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        before_render_template.connect(self._before_render, app)
+        template_rendered.connect(self._after_render, app)
+        # Listening on the Engine class covers every engine the app creates
+        event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', self._after_cursor_execute)
+
+    # --- Request lifecycle ---
+    def _before_request(self):
+        stats = g._instrumentation = RequestStats()
+        if random.random() < self.app.config['PROFILE_SAMPLE_RATE']:
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except (RuntimeError, ValueError):
+                return  # Another request in this process is being profiled
+            stats.profiler = profiler
+
+    def _after_request(self, response):
+        stats = g.get('_instrumentation')
+        if stats is not None:
+            endpoint = request.endpoint or 'unknown'
+            method, status = request.method, response.status_code
+            # Streamed bodies are still being generated here, so the request is
+            # only finished once the server closes the response
+            response.call_on_close(lambda: self._finish(stats, endpoint, method, status))
+        return response
+
+    def _finish(self, stats, endpoint, method, status):
+        duration = time.perf_counter() - stats.started
+        if stats.profiler is not None:
+            stats.profiler.disable()
+            self._dump_profile(stats.profiler, endpoint)
+
+        n_plus_one = [(statement, count) for statement, count in stats.statements.items()
+                      if count >= self.app.config['N_PLUS_ONE_THRESHOLD']]
+        for statement, count in n_plus_one:
+            self.app.logger.warning('Possible N+1 in %s: %d x %s', endpoint, count, statement)
+
+        with self._lock:
+            endpoint_stats = self._endpoints[endpoint]
+            endpoint_stats.requests[(method, status)] += 1
+            endpoint_stats.duration_sum += duration
+            for index, bound in enumerate(DURATION_BUCKETS):
+                if duration <= bound:
+                    endpoint_stats.buckets[index] += 1
+            endpoint_stats.queries += stats.queries
+            endpoint_stats.sql_time += stats.sql_time
+            endpoint_stats.render_time += stats.render_time
+            endpoint_stats.n_plus_one += len(n_plus_one)
+
+    def _dump_profile(self, profiler, endpoint):
+        directory = self.app.config['PROFILE_DIR']
+        os.makedirs(directory, exist_ok=True)
+        name = f'{endpoint}-{time.strftime("%Y%m%d-%H%M%S")}-{os.getpid()}-{random.randrange(10**6)}.prof'
+        profiler.dump_stats(os.path.join(directory, name))
+
+    @staticmethod
+    def _current():
+        if not has_app_context():
+            return None
+        return g.get('_instrumentation')
+
+    # --- Templates ---
+    def _before_render(self, sender, template, context, **extra):
+        stats = self._current()
+        if stats is not None:
+            stats.render_started = time.perf_counter()
+            stats.sql_time_at_render = stats.sql_time
+
+    def _after_render(self, sender, template, context, **extra):
+        stats = self._current()
+        if stats is not None and stats.render_started is not None:
+            # Streamed templates query while rendering; that time counts as SQL
+            sql_during_render = stats.sql_time - stats.sql_time_at_render
+            stats.render_time += time.perf_counter() - stats.render_started - sql_during_render
+            stats.render_started = None
+
+    # --- SQL ---
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        # Kept on the execution context, which is dropped with the statement even
+        # when it fails and after_cursor_execute never runs
+        context._instrumentation_started = time.perf_counter()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - context._instrumentation_started
+        if elapsed * 1000 >= self.app.config['SLOW_QUERY_MS']:
+            with self._lock:
+                self._slow_queries += 1
+            self.app.logger.warning('Slow query (%.1f ms): %s', elapsed * 1000, ' '.join(statement.split()))
+        stats = self._current()
+        if stats is not None:
+            stats.queries += 1
+            stats.sql_time += elapsed
+            stats.statements[normalize_statement(statement)] += 1
+
+    # --- Export ---
+    def render_metrics(self):
+        """Returns the aggregated metrics in the Prometheus text exposition format."""
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            lines.extend(f'{name}{labels} {value}' for labels, value in samples)
+
+        with self._lock:
+            endpoints = sorted(self._endpoints.items())
+            metric('forum_requests_total', 'counter', 'Requests handled, by endpoint, method and status.', [
+                (f'{{endpoint="{endpoint}",method="{method}",status="{status}"}}', count)
+                for endpoint, stats in endpoints
+                for (method, status), count in sorted(stats.requests.items())
+            ])
+            histogram = []
+            for endpoint, stats in endpoints:
+                for bound, count in zip(DURATION_BUCKETS, stats.buckets):
+                    histogram.append((f'_bucket{{endpoint="{endpoint}",le="{bound}"}}', count))
+                total = sum(stats.requests.values())
+                histogram.append((f'_bucket{{endpoint="{endpoint}",le="+Inf"}}', total))
+                histogram.append((f'_sum{{endpoint="{endpoint}"}}', round(stats.duration_sum, 6)))
+                histogram.append((f'_count{{endpoint="{endpoint}"}}', total))
+            metric('forum_request_duration_seconds', 'histogram', 'Total request time.', histogram)
+            for name, attribute, help_text in (
+                ('forum_sql_queries_total', 'queries', 'SQL statements executed.'),
+                ('forum_sql_duration_seconds_total', 'sql_time', 'Time spent executing SQL.'),
+                ('forum_render_duration_seconds_total', 'render_time', 'Time spent rendering templates.'),
+                ('forum_n_plus_one_total', 'n_plus_one', 'Statements repeated N+1 style within a request.'),
+            ):
+                metric(name, 'counter', help_text, [
+                    (f'{{endpoint="{endpoint}"}}', round(getattr(stats, attribute), 6))
+                    for endpoint, stats in endpoints
+                ])
+            metric('forum_slow_queries_total', 'counter', 'Queries slower than SLOW_QUERY_MS.',
+                   [('', self._slow_queries)])
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,75 @@
+"""Read replicas for the SQLAlchemy session.
+
+ReplicaSet hands out replica engines in round-robin order, skipping replicas
+that failed. A replica is marked down when connecting to it fails or a
+connection to it is lost. It is probed again with SELECT 1 at most every
+``check_interval`` seconds, and comes back into rotation once that works.
+When no replica is up, callers fall back to the primary.
+
+Which queries may go to a replica is up to the caller (see RoutingSession
+in app.py); this module only knows about engines.
+
+    replicas = ReplicaSet([create_engine(url) for url in read_urls])
+    engine = replicas.pick()  # None if every replica is down
+"""
+import itertools
+import logging
+import threading
+import time
+
+from sqlalchemy import event, text
+
+logger = logging.getLogger(__name__)
+
+
+class ReplicaSet:
+    def __init__(self, engines, check_interval=10):
+        self.engines = list(engines)
+        self.check_interval = check_interval
+        # engine -> time of the last failed check; each replica is probed before its first use
+        self._down = {engine: float('-inf') for engine in self.engines}
+        self._cycle = itertools.cycle(self.engines)
+        self._lock = threading.Lock()
+        for engine in self.engines:
+            event.listen(engine, 'handle_error', self._handle_error)
+
+    def __bool__(self):
+        return bool(self.engines)
+
+    def pick(self):
+        """Returns the next healthy replica engine, or None."""
+        for _ in range(len(self.engines)):
+            with self._lock:
+                engine = next(self._cycle)
+                failed_at = self._down.get(engine)
+            if failed_at is None:
+                return engine
+            if time.monotonic() - failed_at >= self.check_interval and self.check(engine):
+                return engine
+        return None
+
+    def check(self, engine):
+        """Probes ``engine``, updating its health. Returns True if it answered."""
+        try:
+            with engine.connect() as conn:
+                conn.execute(text('SELECT 1'))
+        except Exception:
+            self.mark_down(engine)
+            return False
+        with self._lock:
+            failed_at = self._down.pop(engine, None)
+        if failed_at is not None and failed_at != float('-inf'):
+            logger.warning('Read replica %s is back', engine.url.render_as_string())
+        return True
+
+    def mark_down(self, engine):
+        with self._lock:
+            previous = self._down.get(engine)
+            self._down[engine] = time.monotonic()
+        if previous is None or previous == float('-inf'):
+            logger.warning('Read replica %s is down, using the others', engine.url.render_as_string())
+
+    def _handle_error(self, context):
+        # Lost connections and failed connects; query errors say nothing about the replica's health
+        if context.is_disconnect or context.connection is None:
+            self.mark_down(context.engine)
@@ -0,0 +1,150 @@
+"""Full-text search over posts and replies.
+
+Every post and reply has one row in the search_index table, written in the
+same transaction as the post or reply itself:
+
+* Postgres: a plain table with a generated tsvector column and a GIN index;
+  queries use websearch_to_tsquery (quotes, OR and -word work), rank with
+  ts_rank_cd and highlight with ts_headline.
+* SQLite: an FTS5 virtual table; every word of the query must match, as a
+  prefix, and results are ranked by bm25.
+
+Rows are keyed by document_id(): post ids map to even and reply ids to odd
+numbers (the FTS5 rowid on SQLite), so a post and its replies can be removed
+by primary key without scanning the index.
+
+Snippets come back as Markup with the matched words in <mark>; everything
+else in them is escaped.
+"""
+from datetime import datetime
+import re
+
+from markupsafe import Markup, escape
+from sqlalchemy import text
+
+# Text search configuration (stemming) on Postgres. It is baked into the
+# generated column, so changing it means rebuilding the index.
+PG_CONFIG = 'russian'
+
+# Highlight markers put around matches by the database; control characters
+# cannot be typed into a post, so they can be swapped for tags after escaping
+_START, _STOP = '\x02', '\x03'
+
+_WORD_RE = re.compile(r'\w+')
+
+
+def document_id(kind, ref_id):
+    return ref_id * 2 + (1 if kind == 'reply' else 0)
+
+
+def create_schema(conn):
+    """Creates search_index if it does not exist yet."""
+    if conn.dialect.name == 'postgresql':
+        conn.execute(text(
+            'CREATE TABLE IF NOT EXISTS search_index ('
+            ' id BIGINT PRIMARY KEY,'
+            ' kind VARCHAR(5) NOT NULL,'
+            ' post_id INTEGER NOT NULL,'
+            ' user_id INTEGER NOT NULL,'
+            ' date TIMESTAMP NOT NULL,'
+            ' content TEXT NOT NULL,'
+            f" document TSVECTOR GENERATED ALWAYS AS (to_tsvector('{PG_CONFIG}', content)) STORED)"
+        ))
+        conn.execute(text('CREATE INDEX IF NOT EXISTS ix_search_index_document ON search_index USING GIN (document)'))
+    else:
+        conn.execute(text(
+            'CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5('
+            ' content, kind UNINDEXED, post_id UNINDEXED, user_id UNINDEXED, date UNINDEXED,'
+            " tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+        ))
+
+
+def rebuild(conn):
+    """Refills search_index from the post and reply tables."""
+    id_column = 'id' if conn.dialect.name == 'postgresql' else 'rowid'
+    conn.execute(text('DELETE FROM search_index'))
+    conn.execute(text(
+        f'INSERT INTO search_index ({id_column}, kind, post_id, user_id, date, content) '
+        "SELECT id * 2, 'post', id, user_id, date, content FROM post"
+    ))
+    conn.execute(text(
+        f'INSERT INTO search_index ({id_column}, kind, post_id, user_id, date, content) '
+        "SELECT id * 2 + 1, 'reply', post_id, user_id, date, content FROM reply"
+    ))
+
+
+def add(session, kind, ref_id, post_id, user_id, date, content):
+    """Indexes a post or reply; call after flushing it, before the commit."""
+    id_column = 'id' if session.get_bind().dialect.name == 'postgresql' else 'rowid'
+    session.execute(text(
+        f'INSERT INTO search_index ({id_column}, kind, post_id, user_id, date, content) '
+        'VALUES (:id, :kind, :post_id, :user_id, :date, :content)'
+    ), {'id': document_id(kind, ref_id), 'kind': kind, 'post_id': post_id, 'user_id': user_id,
+        'date': date, 'content': content})
+
+
+def remove_post(session, post_id, reply_ids):
+    """Drops a post and its replies from the index."""
+    remove_posts(session, [post_id], reply_ids)
+
+
+def remove_posts(session, post_ids, reply_ids):
+    _remove(session, [document_id('post', post_id) for post_id in post_ids]
+            + [document_id('reply', reply_id) for reply_id in reply_ids])
+
+
+def remove_reply(session, reply_id):
+    _remove(session, [document_id('reply', reply_id)])
+
+
+def _remove(session, ids):
+    id_column = 'id' if session.get_bind().dialect.name == 'postgresql' else 'rowid'
+    for start in range(0, len(ids), 500):
+        chunk = ids[start:start + 500]
+        params = {f'id{i}': value for i, value in enumerate(chunk)}
+        placeholders = ', '.join(f':{name}' for name in params)
+        session.execute(text(f'DELETE FROM search_index WHERE {id_column} IN ({placeholders})'), params)
+
+
+def fts5_query(query):
+    """Turns free text into an FTS5 query: every word, as a quoted prefix."""
+    return ' '.join(f'"{word}"*' for word in _WORD_RE.findall(query)[:16])
+
+
+class SearchHit:
+    def __init__(self, kind, post_id, username, date, snippet):
+        self.kind = kind
+        self.post_id = post_id
+        self.username = username
+        if isinstance(date, str):  # FTS5 columns hold the raw text
+            date = datetime.fromisoformat(date)
+        self.date = date
+        self.snippet = Markup(str(escape(snippet)).replace(_START, '<mark>').replace(_STOP, '</mark>'))
+
+
+def search(session, query, limit, offset=0):
+    """Returns up to ``limit`` SearchHits for ``query``, best match first."""
+    if session.get_bind().dialect.name == 'postgresql':
+        rows = session.execute(text(
+            'SELECT hit.kind, hit.post_id, u.username, hit.date,'
+            f"       ts_headline('{PG_CONFIG}', hit.content, websearch_to_tsquery('{PG_CONFIG}', :q),"
+            "                   'StartSel=\x02, StopSel=\x03, MaxWords=30, MinWords=10, MaxFragments=2')"
+            ' FROM (SELECT id, kind, post_id, user_id, date, content, ts_rank_cd(document, query) AS rank'
+            f"       FROM search_index, websearch_to_tsquery('{PG_CONFIG}', :q) AS query"
+            '       WHERE document @@ query'
+            '       ORDER BY rank DESC, id DESC LIMIT :limit OFFSET :offset) AS hit'
+            ' JOIN "user" u ON u.id = hit.user_id'
+            ' ORDER BY hit.rank DESC, hit.id DESC'
+        ), {'q': query, 'limit': limit, 'offset': offset})
+    else:
+        match = fts5_query(query)
+        if not match:
+            return []
+        rows = session.execute(text(
+            'SELECT search_index.kind, search_index.post_id, u.username, search_index.date,'
+            "       snippet(search_index, 0, char(2), char(3), '…', 24)"
+            ' FROM search_index JOIN "user" u ON u.id = search_index.user_id'
+            ' WHERE search_index MATCH :q'
+            ' ORDER BY rank LIMIT :limit OFFSET :offset'
+        ), {'q': match, 'limit': limit, 'offset': offset})
+    return [SearchHit(*row) for row in rows]
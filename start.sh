@@ -1,3 +1,5 @@
 #!/bin/bash
+set -e # A failed asset build or migration must fail the deploy, not ship an unstyled site
+python build_assets.py
 flask init-db
-gunicorn app:app --workers 4 --bind 0.0.0.0:$PORT
\ No newline at end of file
+gunicorn app:app # Settings in gunicorn.conf.py
\ No newline at end of file
@@ -0,0 +1,32 @@
+"""Shared test setup: the app runs against a throwaway SQLite file, never forum.db."""
+import os
+import sys
+import tempfile
+
+import pytest
+
+# Read by app.py at import time, so set before any test module imports it
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='forum-tests-'), 'forum.db')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app, cache, db, stamp_schema  # noqa: E402
+
+
+@pytest.fixture
+def database():
+    """A freshly created and stamped schema, with an empty fragment and user cache."""
+    with app.app_context():
+        db.session.remove()
+        db.drop_all(bind_key=None)
+        db.session.execute(db.text('DROP TABLE IF EXISTS search_index'))  # not a model, see search.py
+        db.session.commit()
+        db.create_all(bind_key=None)
+        stamp_schema()
+    cache.clear()
+    yield db
+    cache.clear()
+
+
+@pytest.fixture
+def client(database):
+    return app.test_client()
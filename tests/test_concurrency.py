@@ -0,0 +1,31 @@
+"""Reads and writes at the same time on the SQLite database."""
+import time
+
+from app import app, db, Post, User
+
+
+def test_feed_reads_while_a_write_transaction_is_open(client):
+    with app.app_context():
+        db.session.add(User(username='alice', password_hash='x'))
+        db.session.commit()
+        assert db.session.execute(db.text('PRAGMA journal_mode')).scalar() == 'wal'
+        user_id = db.session.scalars(db.select(User.id)).one()
+
+        with db.engine.connect() as writer:
+            # The strongest write lock: with a rollback journal it shuts out readers, as a
+            # write does while it commits; in WAL mode readers carry on from the last commit
+            writer.exec_driver_sql('BEGIN EXCLUSIVE')
+            writer.execute(Post.__table__.insert().values(content='Черновик', user_id=user_id))
+
+            started = time.perf_counter()
+            response = client.get('/')
+            body = response.get_data(as_text=True)
+            elapsed = time.perf_counter() - started
+
+            assert response.status_code == 200
+            assert 'Черновик' not in body  # readers see the last committed state
+            # A rollback journal would make the read wait for the busy timeout (5 s)
+            assert elapsed < 1, elapsed
+            writer.commit()
+
+    assert 'Черновик' in client.get('/').get_data(as_text=True)
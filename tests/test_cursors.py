@@ -0,0 +1,30 @@
+"""Feed and reply cursors from the query string."""
+from datetime import datetime
+
+from app import app, db, decode_cursor, MAX_CURSOR_ID, User, Post
+
+
+def test_decode_cursor():
+    assert decode_cursor('20260101000000000000-42') == (datetime(2026, 1, 1), 42)
+    assert decode_cursor(f'20260101000000000000-{MAX_CURSOR_ID}') == (datetime(2026, 1, 1), MAX_CURSOR_ID)
+    for value in ('', 'junk', '2026-1', '20260101000000000000-x', '20260101000000000000--1',
+                  f'20260101000000000000-{MAX_CURSOR_ID + 1}', '20260101000000000000-99999999999999999999999'):
+        assert decode_cursor(value) is None, value
+
+
+def test_out_of_range_cursor_ids_are_ignored(client):
+    with app.app_context():
+        user = User(username='alice', password_hash='x')
+        db.session.add(user)
+        db.session.flush()
+        db.session.add(Post(content='Привет', user_id=user.id))
+        db.session.commit()
+        post_id = db.session.scalars(db.select(Post.id)).one()
+
+    cursor = '20260101000000000000-99999999999999999999999'
+    for path in (f'/?before={cursor}', f'/?after={cursor}', f'/post/{post_id}/replies?after={cursor}'):
+        response = client.get(path)
+        body = response.get_data(as_text=True)
+        response.close()
+        assert response.status_code == 200, path
+        assert 'Привет' in body, path
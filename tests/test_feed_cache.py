@@ -0,0 +1,20 @@
+"""Conditional requests for the feed."""
+from werkzeug.security import generate_password_hash
+
+from app import app, db, User
+
+
+def test_a_write_in_the_same_second_changes_last_modified(client):
+    with app.app_context():
+        db.session.add(User(username='alice', password_hash=generate_password_hash('secret')))
+        db.session.commit()
+    author = app.test_client()
+    author.post('/login', data={'username': 'alice', 'password': 'secret'})
+
+    before = client.get('/').headers['Last-Modified']
+    assert client.get('/', headers={'If-Modified-Since': before}).status_code == 304
+
+    author.post('/post', data={'content': 'Привет'})  # well within a second of the first response
+    response = client.get('/', headers={'If-Modified-Since': before})
+    assert response.status_code == 200
+    assert 'Привет' in response.get_data(as_text=True)
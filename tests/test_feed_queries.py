@@ -0,0 +1,59 @@
+"""The feed runs a fixed number of SQL queries, however many posts and replies there are."""
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+
+from app import app, cache, db, recount_replies, User, Post, Reply
+
+
+def seed(posts, replies_per_post, users=5):
+    """Adds ``posts`` posts with ``replies_per_post`` replies each, from ``users`` authors."""
+    with app.app_context():
+        first_user = db.session.query(db.func.count(User.id)).scalar()
+        db.session.execute(User.__table__.insert(), [
+            {'username': f'user{first_user + i}', 'password_hash': 'x', 'is_admin': False} for i in range(users)])
+        user_ids = db.session.scalars(db.select(User.id)).all()
+        start = datetime(2024, 1, 1) + timedelta(days=db.session.query(db.func.count(Post.id)).scalar())
+        for i in range(posts):
+            post = Post(content=f'Сообщение {i}', user_id=user_ids[i % len(user_ids)], date=start + timedelta(minutes=i))
+            db.session.add(post)
+            db.session.flush()
+            db.session.execute(Reply.__table__.insert(), [
+                {'content': f'Ответ {j}', 'post_id': post.id, 'user_id': user_ids[j % len(user_ids)],
+                 'date': post.date + timedelta(seconds=j)} for j in range(replies_per_post)])
+        recount_replies(db.session.connection())
+        db.session.commit()
+
+
+def count_feed_queries(client, path='/'):
+    """SQL statements run by one request for ``path``, with an empty fragment cache."""
+    cache.clear()
+    queries = []
+
+    def count(*args):
+        queries.append(args[2])
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', count)
+    try:
+        response = client.get(path)
+        body = response.get_data(as_text=True)  # the feed is streamed
+        response.close()
+    finally:
+        event.remove(engine, 'before_cursor_execute', count)
+    assert response.status_code == 200
+    assert body.count('<article') == app.config['FEED_PAGE_SIZE']
+    return len(queries)
+
+
+def test_feed_query_count_does_not_grow_with_data(client):
+    seed(posts=app.config['FEED_PAGE_SIZE'] + 10, replies_per_post=2)
+    small = count_feed_queries(client)
+
+    # Ten times the posts, deeper threads and more authors
+    seed(posts=(app.config['FEED_PAGE_SIZE'] + 10) * 10, replies_per_post=20, users=50)
+    large = count_feed_queries(client)
+
+    assert large == small
+
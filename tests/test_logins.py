@@ -0,0 +1,35 @@
+"""Password hashing under concurrent logins."""
+import threading
+
+import pytest
+from werkzeug.security import generate_password_hash
+
+from app import app, db, User
+from hashing import PasswordHasher, PoolBusy
+
+
+def test_a_burst_of_logins_is_queued_not_rejected(database):
+    with app.app_context():
+        db.session.add(User(username='alice', password_hash=generate_password_hash('secret')))
+        db.session.commit()
+    statuses = []
+
+    def log_in():
+        response = app.test_client().post('/login', data={'username': 'alice', 'password': 'secret'})
+        statuses.append(response.status_code)
+
+    threads = [threading.Thread(target=log_in) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert statuses == [302] * 8
+
+
+def test_a_hash_that_times_out_is_reported_as_busy():
+    hasher = PasswordHasher(max_workers=1, max_queue=0, timeout=0.001)  # a hash takes tens of ms
+    try:
+        with pytest.raises(PoolBusy):
+            hasher.generate('secret')
+    finally:
+        hasher.shutdown()
@@ -0,0 +1,22 @@
+"""Fresh databases match what the migrations produce."""
+from app import app, current_schema_version, db, FeedState, MIGRATIONS
+
+
+def test_stamped_database_has_the_feed_state_row(database):
+    with app.app_context():
+        assert current_schema_version() == MIGRATIONS[-1][0]
+        # Writes only UPDATE it, so concurrent first writes cannot both INSERT it
+        state = db.session.get(FeedState, 1)
+        assert state is not None and state.version == 1
+
+
+def test_db_upgrade_on_a_new_database(database):
+    with app.app_context():
+        # An empty database: create_all() in db-upgrade builds the current tables,
+        # then every migration runs on top of them
+        db.drop_all(bind_key=None)
+        db.session.commit()
+    result = app.test_cli_runner().invoke(args=['db-upgrade'])
+    assert result.exception is None, result.output
+    with app.app_context():
+        assert current_schema_version() == MIGRATIONS[-1][0]